@@ -0,0 +1,293 @@
+import asyncio
+import concurrent.futures
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    # Optional dependency, only needed for AsyncYouTubeClient
+    aiohttp = None
+
+from quota import QuotaExceededError
+from resilience import (
+    RETRYABLE_REASONS, RETRYABLE_STATUSES, CircuitBreaker, RequestMetrics, RetriesExhaustedError, RetryPolicy,
+)
+from youtube_data import (
+    CHANNELS_PER_REQUEST, COMMENTS_PER_PAGE, QUOTA_ERROR_REASONS, VIDEOS_PER_REQUEST,
+    build_channel_information, build_comment_information, build_video_information, chunked,
+)
+
+
+API_BASE_URL = "https://youtube.googleapis.com/youtube/v3/"
+
+
+class AsyncYouTubeClient:
+    # asyncio counterpart of the YouTubeDataPipeline fetch methods, returning the same record dicts.
+    # Many requests share a few keep-alive connections, max_in_flight caps the requests awaiting a response.
+    #
+    #     async with AsyncYouTubeClient(api_key) as client:
+    #         comments = await client.get_comments_info(channel_id)
+
+    def __init__(self, api_key, max_in_flight=100, connection_limit=100, timeout=30.0,
+                 quota_scheduler=None, retry_policy=None, circuit_breaker=None, request_metrics=None):
+        if aiohttp is None:
+            raise ImportError("AsyncYouTubeClient requires aiohttp, install it with pip install aiohttp")
+
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.connection_limit = connection_limit
+        self.timeout = timeout
+
+        # Same optional QuotaScheduler and resilience helpers as YouTubeDataPipeline, and shareable with it
+        self.quota_scheduler = quota_scheduler
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.request_metrics = request_metrics or RequestMetrics()
+
+        self.session = None
+        self._semaphore = None
+        self._quota_executor = None
+        self._channel_resources = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            # HTTP/1.1 keep-alive pool, connections are reused across requests and pages
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                # Per-socket timeouts: with more requests in flight than pooled connections, time spent
+                # waiting for a free connection must not count against the request
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+                raise_for_status=False,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            # QuotaScheduler.acquire blocks while it paces requests. It runs on its own thread so paced
+            # requests never fill the loop's default executor, which aiohttp also needs for DNS lookups.
+            self._quota_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="youtube-quota")
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self._quota_executor is not None:
+            self._quota_executor.shutdown(wait=False, cancel_futures=True)
+            self._quota_executor = None
+
+    async def request(self, endpoint, **params):
+        # Returns the decoded response, or None for errors that are not worth retrying (e.g. comments disabled)
+        await self.open()
+        params = {key: value for key, value in params.items() if value is not None}
+        params["key"] = self.api_key
+        attempt = 1
+
+        while True:
+            if self.quota_scheduler is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._quota_executor, self.quota_scheduler.acquire, endpoint)
+            self.circuit_breaker.before_request()
+
+            started = time.perf_counter()
+            error = None
+            try:
+                async with self._semaphore:
+                    async with self.session.get(API_BASE_URL + endpoint, params=params) as response:
+                        status = response.status
+                        try:
+                            body = await response.json(content_type=None)
+                        except ValueError:
+                            # Proxies and load balancers may answer errors with HTML
+                            body = None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, body, error = None, None, e
+
+            latency = time.perf_counter() - started
+            if status == 200:
+                self.request_metrics.record(endpoint, latency)
+                self.circuit_breaker.record_success()
+                return body
+
+            self.request_metrics.record(endpoint, latency, failed=True)
+            reason = error_reason(body)
+            if reason in QUOTA_ERROR_REASONS:
+                if self.quota_scheduler is not None:
+                    self.quota_scheduler.mark_exhausted()
+                raise QuotaExceededError(f"YouTube API quota exhausted: {reason}")
+
+            retryable = error is not None or status in RETRYABLE_STATUSES or (
+                status == 403 and reason in RETRYABLE_REASONS)
+            if not retryable:
+                # The API answered, a client error says nothing about its health
+                self.circuit_breaker.record_success()
+                print(f"Error making YouTube API request: {endpoint} returned {status} ({reason})")
+                return None
+
+            self.circuit_breaker.record_failure()
+            if attempt >= self.retry_policy.max_attempts:
+                raise RetriesExhaustedError(
+                    f"{endpoint} request failed after {attempt} attempts: {error or status}")
+
+            self.request_metrics.record_retry(endpoint)
+            await asyncio.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+
+    async def iter_pages(self, endpoint, **params):
+        # Follow nextPageToken, yielding each page as it arrives
+        page_token = None
+        while True:
+            response = await self.request(endpoint, pageToken=page_token, **params)
+            if not response:
+                return
+            yield response
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    async def get_channel_resources(self, channel_ids):
+        # {channel_id: item or None}, batches of 50 IDs requested concurrently.
+        # As in YouTubeDataPipeline, IDs of a batch whose request failed are left out.
+        channel_ids = list(dict.fromkeys(channel_ids))
+        missing_ids = [channel_id for channel_id in channel_ids if channel_id not in self._channel_resources]
+        failed_ids = set()
+
+        async def fetch_batch(channel_id_batch):
+            response = await self.request(
+                "channels",
+                part="snippet,statistics,contentDetails",
+                id=",".join(channel_id_batch),
+            )
+            if response is None:
+                failed_ids.update(channel_id_batch)
+                return
+            for item in response.get("items", []):
+                self._channel_resources[item["id"]] = item
+
+        await asyncio.gather(*(fetch_batch(batch) for batch in chunked(missing_ids, CHANNELS_PER_REQUEST)))
+        return {
+            channel_id: self._channel_resources.get(channel_id)
+            for channel_id in channel_ids if channel_id not in failed_ids
+        }
+
+    async def get_channels_info(self, channel_ids):
+        return {
+            channel_id: build_channel_information(channel_resource, channel_id) if channel_resource else None
+            for channel_id, channel_resource in (await self.get_channel_resources(channel_ids)).items()
+        }
+
+    async def get_channel_info(self, channel_id):
+        return (await self.get_channels_info([channel_id])).get(channel_id)
+
+    async def uploads_playlist_id(self, channel_id):
+        channel_resource = (await self.get_channel_resources([channel_id])).get(channel_id)
+        if channel_resource is None:
+            return None
+        return channel_resource["contentDetails"]["relatedPlaylists"]["uploads"]
+
+    async def iter_video_ids(self, channel_id):
+        playlist_id = await self.uploads_playlist_id(channel_id)
+        if playlist_id is None:
+            return
+
+        async for page in self.iter_pages(
+                "playlistItems", part="contentDetails", playlistId=playlist_id, maxResults=50):
+            for item in page.get("items", []):
+                yield item["contentDetails"]["videoId"]
+
+    async def get_video_ids(self, channel_id):
+        return [video_id async for video_id in self.iter_video_ids(channel_id)]
+
+    async def iter_videos_info(self, channel_id, video_ids=None):
+        # Video records in batches of 50 IDs, batches are requested concurrently
+        playlist_id = await self.uploads_playlist_id(channel_id)
+        if playlist_id is None:
+            return
+        if video_ids is None:
+            video_ids = await self.get_video_ids(channel_id)
+
+        async def fetch_batch(video_id_batch):
+            response = await self.request(
+                "videos",
+                part="snippet,statistics,contentDetails",
+                id=",".join(video_id_batch),
+            )
+            return video_id_batch, {item["id"]: item for item in (response or {}).get("items", [])}
+
+        tasks = [asyncio.ensure_future(fetch_batch(batch)) for batch in chunked(video_ids, VIDEOS_PER_REQUEST)]
+        try:
+            for task in tasks:
+                video_id_batch, returned_items = await task
+                for video_id in video_id_batch:
+                    video_item = returned_items.get(video_id)
+                    if video_item is None:
+                        print(f"Video {video_id} not returned by the API (deleted, private or failed request), skipping")
+                        continue
+                    try:
+                        yield build_video_information(video_item, channel_id, playlist_id)
+                    except KeyError as e:
+                        print(f"Error processing video {video_id}: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_videos_info(self, channel_id, video_ids=None):
+        return [video async for video in self.iter_videos_info(channel_id, video_ids)]
+
+    async def iter_video_comments(self, video_id, max_comments=None):
+        # Comment records of one video, page by page, up to max_comments
+        count = 0
+        page_token = None
+        while max_comments is None or count < max_comments:
+            page_size = COMMENTS_PER_PAGE
+            if max_comments is not None:
+                page_size = min(page_size, max_comments - count)
+
+            response = await self.request(
+                "commentThreads", part="snippet", videoId=video_id, maxResults=page_size, pageToken=page_token)
+            # Comments disabled or request failed
+            if not response:
+                return
+
+            for item in response.get("items", [])[:page_size]:
+                yield build_comment_information(item, video_id)
+                count += 1
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    async def get_video_comments(self, video_id, max_comments=None):
+        return [comment async for comment in self.iter_video_comments(video_id, max_comments)]
+
+    async def iter_comments_info(self, channel_id, video_ids=None, max_comments=None):
+        # Every video is fetched concurrently, the semaphore bounds the requests in flight.
+        # Comments are yielded one video at a time as videos complete.
+        if video_ids is None:
+            video_ids = await self.get_video_ids(channel_id)
+
+        tasks = [asyncio.ensure_future(self.get_video_comments(video_id, max_comments)) for video_id in video_ids]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for comment in await next_done:
+                    yield comment
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_comments_info(self, channel_id, video_ids=None, max_comments=None):
+        return [comment async for comment in self.iter_comments_info(channel_id, video_ids, max_comments)]
+
+
+def error_reason(body):
+    # First error reason of an API error body, e.g. "quotaExceeded"
+    try:
+        return body["error"]["errors"][0]["reason"]
+    except (KeyError, IndexError, TypeError):
+        return None
@@ -0,0 +1,144 @@
+import argparse
+import os
+import sys
+import time
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, IngestionJobQueue
+from quota import DEFAULT_DAILY_BUDGET, QuotaScheduler
+from youtube_data import DIRECT_LOAD, MONGODB_LOAD, STREAM_BATCH_SIZE, YouTubeDataPipeline
+
+
+# Exit codes for cron: everything ingested, some channels failed, stopped or held back by the API quota
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_QUOTA = 2
+
+
+def read_channel_ids(path):
+    # One channel ID per line, commas are accepted too, blank lines and # comments are ignored
+    channel_ids = []
+    with open(path, encoding="utf-8") as channels_file:
+        for line in channels_file:
+            line = line.split("#", 1)[0]
+            channel_ids.extend(channel_id.strip() for channel_id in line.split(",") if channel_id.strip())
+    return list(dict.fromkeys(channel_ids))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Ingest YouTube channels into SQLite and MongoDB without the dashboard. "
+                    "Progress is checkpointed per channel and stage, rerunning the same batch resumes it.")
+    parser.add_argument("channels_file", nargs="?", help="file with one YouTube channel ID per line")
+    parser.add_argument("--batch", help="checkpoint name of the run (default: the channels file name)")
+    parser.add_argument("--workers", type=int, default=4, help="channels ingested in parallel (default: 4)")
+    parser.add_argument("--incremental", action="store_true", help="only fetch uploads published since the channel's last completed sync")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ingest channels again even if they already succeeded in this batch")
+    parser.add_argument("--max-comments-per-video", type=int, help="cap comments fetched per video")
+    parser.add_argument("--daily-budget", type=int, default=DEFAULT_DAILY_BUDGET,
+                        help=f"YouTube API quota units available per day, units already spent today "
+                             f"are read from the database (default: {DEFAULT_DAILY_BUDGET})")
+    parser.add_argument("--load-mode", choices=(DIRECT_LOAD, MONGODB_LOAD), default=DIRECT_LOAD)
+    parser.add_argument("--stream-batch-size", type=int, default=STREAM_BATCH_SIZE,
+                        help=f"commit videos and comments every N records, 0 loads each stage at once "
+                             f"(default: {STREAM_BATCH_SIZE})")
+    parser.add_argument("--sqlite-path", default="youtube_data.sqlite")
+    parser.add_argument("--response-cache-path", default="youtube_api_cache.sqlite")
+    parser.add_argument("--progress-interval", type=float, default=10.0,
+                        help="seconds between progress lines (default: 10)")
+    parser.add_argument("--split-legacy-mongodb-collection", action="store_true",
+                        help="one-off: copy the documents of the shared --mongodb-collection into the "
+                             "per-entity _channels, _videos and _comments collections, then exit")
+
+    # Credentials default to the same names as the dashboard secrets
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY"))
+    parser.add_argument("--mongodb-uri", default=os.environ.get("MONGODB_URI"))
+    parser.add_argument("--mongodb-database", default=os.environ.get("MONGODB_DATABASE", "moonwalker"))
+    parser.add_argument("--mongodb-collection", default=os.environ.get("MONGODB_COLLECTION", "youtube_data"))
+
+    args = parser.parse_args(argv)
+    if not args.channels_file and not args.split_legacy_mongodb_collection:
+        parser.error("the channels_file argument is required")
+    if not args.api_key:
+        parser.error("a YouTube API key is required, pass --api-key or set API_KEY")
+    if not args.mongodb_uri:
+        parser.error("a MongoDB connection string is required, pass --mongodb-uri or set MONGODB_URI")
+    return args
+
+
+def format_counts(counts):
+    return ", ".join(f"{status} {counts.get(status, 0)}" for status in (QUEUED, RUNNING, SUCCEEDED, FAILED))
+
+
+def split_legacy_mongodb_collection(pipeline_config):
+    pipeline = YouTubeDataPipeline(**pipeline_config)
+    try:
+        copied = pipeline.split_legacy_mongodb_collection()
+    finally:
+        pipeline.close_connections()
+    for collection_name, count in copied.items():
+        print(f"Copied {count} documents into {collection_name}")
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    pipeline_config = {
+        "api_key": args.api_key,
+        "sqlite_path": args.sqlite_path,
+        "mongodb_connection_string": args.mongodb_uri,
+        "mongodb_database": args.mongodb_database,
+        "mongodb_collection": args.mongodb_collection,
+        "max_comments_per_video": args.max_comments_per_video,
+        "response_cache_path": args.response_cache_path,
+        # Usage is stored in the database, reruns on the same quota day continue from what was spent
+        "quota_scheduler": QuotaScheduler(args.daily_budget, sqlite_path=args.sqlite_path),
+        "load_mode": args.load_mode,
+    }
+
+    if args.split_legacy_mongodb_collection:
+        return split_legacy_mongodb_collection(pipeline_config)
+
+    channel_ids = read_channel_ids(args.channels_file)
+    batch = args.batch or os.path.basename(args.channels_file)
+
+    # Jobs left over from an interrupted run of this batch are queued again on start
+    job_queue = IngestionJobQueue(pipeline_config, workers=args.workers, batch=batch, stop_on_quota=True,
+                                  stream_batch_size=args.stream_batch_size or None)
+    job_queue.enqueue_many(channel_ids, incremental=args.incremental, skip_succeeded=not args.refresh)
+    print(f"Batch {batch}: {len(channel_ids)} channels, {format_counts(job_queue.status_counts())}")
+
+    started = time.perf_counter()
+    try:
+        while not job_queue.idle():
+            time.sleep(min(args.progress_interval, 1.0))
+            if time.perf_counter() - started >= args.progress_interval:
+                started = time.perf_counter()
+                print(f"Batch {batch}: {format_counts(job_queue.status_counts())}")
+    except KeyboardInterrupt:
+        # Running jobs stop at their next page or batch and resume at their current stage on the next run.
+        # Closing the queue also lets the MongoDB sink write the batches already committed to SQLite.
+        print("Interrupted, stopping the workers...")
+        job_queue.close(cancel_pending=True)
+        print(f"Interrupted, rerun with --batch {batch} to resume.")
+        return EXIT_FAILURES
+
+    counts = job_queue.status_counts()
+    job_queue.close()
+    print(f"Batch {batch} finished: {format_counts(counts)}")
+
+    if job_queue.quota_exhausted.is_set():
+        print(f"YouTube API quota exhausted, rerun with --batch {batch} after the quota resets.")
+        return EXIT_QUOTA
+    if job_queue.quota_deferred.is_set():
+        print(f"{counts.get(QUEUED, 0)} channels were not started to leave the quota budget to channels "
+              f"in progress, rerun with --batch {batch} after the quota resets.")
+        return EXIT_QUOTA
+    if counts.get(FAILED, 0):
+        return EXIT_FAILURES
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,412 @@
+import datetime
+import json
+import queue
+import sqlite3
+import threading
+import uuid
+
+from migrations import apply_migrations
+from mongodb_sink import MongoDBSinkError
+from quota import INTERACTIVE_PRIORITY, QuotaExceededError, QuotaReserveError
+from youtube_data import YouTubeDataPipeline, configure_sqlite_connection
+
+
+JOB_STAGES = ("channels", "videos", "comments")
+
+# Running jobs are leased to the queue that claimed them. The owner renews the lease while it runs,
+# a job whose lease is older than the timeout was left behind by a stopped process and is queued again.
+LEASE_TIMEOUT_SECONDS = 120
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def utc_now():
+    # Same format as SQLite's datetime('now')
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def empty_progress():
+    return {stage: {"pages": 0, "rows": 0} for stage in JOB_STAGES}
+
+
+class IngestionJobQueue:
+    # Runs channel ingests on background worker threads. Jobs are persisted in the
+    # ingestion_jobs table, live page and row counts are kept in memory and saved at stage boundaries.
+    # The stage column is the job's checkpoint: an interrupted job resumes at the stage it was in.
+    # Several queues, e.g. the dashboard and ingest_cli, may share a database: each running job is
+    # leased to the queue that claimed it, see LEASE_TIMEOUT_SECONDS.
+
+    def __init__(self, pipeline_config, workers=4, batch=None, stop_on_quota=False, stream_batch_size=None,
+                 lease_timeout=LEASE_TIMEOUT_SECONDS):
+        # pipeline_config holds the YouTubeDataPipeline constructor arguments, incremental is set per job
+        self.pipeline_config = {key: value for key, value in pipeline_config.items() if key != "incremental"}
+        # Jobs are grouped by batch name, a queue only runs the jobs of its own batch.
+        # Command-line runs name theirs, the dashboard names one per set of credentials.
+        self.batch = batch
+        # With stop_on_quota, a quota error puts the job back in the queue and the workers stop taking jobs.
+        # Channels refused by the quota reserve are put back too, but the workers go on finishing started ones.
+        self.stop_on_quota = stop_on_quota
+        self.quota_exhausted = threading.Event()
+        self.quota_deferred = threading.Event()
+        # With stream_batch_size, the video and comment stages commit every stream_batch_size records
+        self.stream_batch_size = stream_batch_size
+        self.sqlite_connection = configure_sqlite_connection(
+            sqlite3.connect(pipeline_config["sqlite_path"], check_same_thread=False))
+        self._sqlite_lock = threading.Lock()
+        apply_migrations(self.sqlite_connection)
+
+        # Single write path for the workers' pipelines: one connection, one transaction at a time.
+        # Job bookkeeping above stays on its own connection so the dashboard never waits on a batch.
+        self._writer_connection = configure_sqlite_connection(
+            sqlite3.connect(pipeline_config["sqlite_path"], check_same_thread=False))
+        self._writer_lock = threading.RLock()
+
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._progress = {}
+        self._progress_lock = threading.Lock()
+
+        # Other processes may run queues on the same database, each running job names its owner
+        self.owner = uuid.uuid4().hex
+        self.lease_timeout = lease_timeout
+        self._closed = threading.Event()
+
+        # Jobs of this batch interrupted by a restart are picked up again, jobs of live queues are left alone
+        self.requeue_expired_jobs()
+        with self._sqlite_lock:
+            pending = self.sqlite_connection.execute(
+                "SELECT job_id FROM ingestion_jobs WHERE status = ? AND batch IS ? ORDER BY job_id",
+                (QUEUED, batch),
+            ).fetchall()
+        for (job_id,) in pending:
+            self._queue.put(job_id)
+
+        self._workers = []
+        for index in range(max(1, int(workers))):
+            worker = threading.Thread(target=self._run_worker, name=f"ingestion-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+        self._heartbeat = threading.Thread(target=self._run_heartbeat, name="ingestion-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def enqueue(self, channel_id, incremental=False):
+        # Returns the job ID, a channel that is already queued or running is not queued twice
+        return self.enqueue_many([channel_id], incremental)[0]
+
+    def enqueue_many(self, channel_ids, incremental=False, skip_succeeded=False):
+        # Queues the channels in one transaction and returns their job IDs. Channels with a queued
+        # or running job in this batch keep that job, with skip_succeeded finished channels are left out.
+        skipped_statuses = (QUEUED, RUNNING, SUCCEEDED) if skip_succeeded else (QUEUED, RUNNING)
+        placeholders = ", ".join("?" * len(skipped_statuses))
+        job_ids = []
+        new_job_ids = []
+
+        with self._sqlite_lock, self.sqlite_connection:
+            for channel_id in dict.fromkeys(channel_id.strip() for channel_id in channel_ids):
+                row = self.sqlite_connection.execute(
+                    f"SELECT job_id FROM ingestion_jobs WHERE channel_id = ? AND batch IS ? "
+                    f"AND status IN ({placeholders}) ORDER BY job_id DESC",
+                    (channel_id, self.batch, *skipped_statuses),
+                ).fetchone()
+                if row:
+                    job_ids.append(row[0])
+                    continue
+
+                cursor = self.sqlite_connection.execute(
+                    """
+                    INSERT INTO ingestion_jobs (channel_id, incremental, status, progress, created_at, batch)
+                    VALUES (?, ?, ?, ?, datetime('now'), ?)
+                    """,
+                    (channel_id, bool(incremental), QUEUED, json.dumps(empty_progress()), self.batch),
+                )
+                job_ids.append(cursor.lastrowid)
+                new_job_ids.append(cursor.lastrowid)
+
+        for job_id in new_job_ids:
+            self._queue.put(job_id)
+        return job_ids
+
+    def status_counts(self):
+        # {status: number of channels} for this batch, by the latest job of each channel
+        with self._sqlite_lock:
+            rows = self.sqlite_connection.execute(
+                """
+                SELECT status, COUNT(*) FROM ingestion_jobs
+                WHERE job_id IN (SELECT MAX(job_id) FROM ingestion_jobs WHERE batch IS ? GROUP BY channel_id)
+                GROUP BY status
+                """,
+                (self.batch,),
+            )
+            return dict(rows.fetchall())
+
+    def idle(self):
+        # True once every queued job has been taken and finished, or skipped after a quota stop
+        return self._queue.unfinished_tasks == 0
+
+    def jobs(self, limit=50):
+        # Latest jobs first, running jobs carry their live progress
+        with self._sqlite_lock:
+            rows = self.sqlite_connection.execute(
+                """
+                SELECT job_id, channel_id, channel_name, incremental, status, stage, progress, error,
+                       created_at, started_at, finished_at
+                FROM ingestion_jobs ORDER BY job_id DESC LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+
+        jobs = []
+        for (job_id, channel_id, channel_name, incremental, status, stage, progress, error,
+             created_at, started_at, finished_at) in rows:
+            with self._progress_lock:
+                live_progress = self._progress.get(job_id)
+                if live_progress:
+                    progress = {name: dict(counts) for name, counts in live_progress.items()}
+                else:
+                    progress = json.loads(progress or "{}")
+            jobs.append({
+                "job_id": job_id,
+                "channel_id": channel_id,
+                "channel_name": channel_name,
+                "incremental": bool(incremental),
+                "status": status,
+                "stage": stage,
+                "progress": progress,
+                "error": error,
+                "created_at": created_at,
+                "started_at": started_at,
+                "finished_at": finished_at,
+            })
+        return jobs
+
+    def record_progress(self, job_id, stage, pages=0, rows=0):
+        # Pipeline progress callback, called from the pipeline's fetch threads
+        with self._progress_lock:
+            stage_progress = self._progress.setdefault(job_id, empty_progress()).setdefault(
+                stage, {"pages": 0, "rows": 0})
+            stage_progress["pages"] += pages
+            stage_progress["rows"] += rows
+
+    def update_job(self, job_id, **columns):
+        # Only jobs claimed by this queue, a job taken over after its lease expired is left to its new owner
+        with self._progress_lock:
+            if job_id in self._progress:
+                columns["progress"] = json.dumps(self._progress[job_id])
+
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._sqlite_lock, self.sqlite_connection:
+            self.sqlite_connection.execute(
+                f"UPDATE ingestion_jobs SET {assignments} WHERE job_id = ? AND owner = ?",
+                (*columns.values(), job_id, self.owner),
+            )
+
+    def requeue_expired_jobs(self):
+        # Running jobs of this batch whose owner stopped renewing the lease go back to the queue,
+        # returns their job IDs
+        lease_expired = "(heartbeat_at IS NULL OR heartbeat_at < datetime('now', ?))"
+        lease_modifier = f"-{self.lease_timeout} seconds"
+        requeued = []
+
+        with self._sqlite_lock, self.sqlite_connection:
+            rows = self.sqlite_connection.execute(
+                f"SELECT job_id FROM ingestion_jobs WHERE status = ? AND batch IS ? AND {lease_expired}",
+                (RUNNING, self.batch, lease_modifier),
+            ).fetchall()
+            for (job_id,) in rows:
+                # The owner may have renewed the lease since the SELECT
+                cursor = self.sqlite_connection.execute(
+                    f"UPDATE ingestion_jobs SET status = ? WHERE job_id = ? AND status = ? AND {lease_expired}",
+                    (QUEUED, job_id, RUNNING, lease_modifier),
+                )
+                if cursor.rowcount == 1:
+                    requeued.append(job_id)
+        return requeued
+
+    def _run_heartbeat(self):
+        # Renews the leases of this queue's running jobs and picks up jobs abandoned by other queues
+        while not self._closed.wait(self.lease_timeout / 8):
+            try:
+                with self._sqlite_lock, self.sqlite_connection:
+                    self.sqlite_connection.execute(
+                        "UPDATE ingestion_jobs SET heartbeat_at = datetime('now') WHERE owner = ? AND status = ?",
+                        (self.owner, RUNNING),
+                    )
+                for job_id in self.requeue_expired_jobs():
+                    self._queue.put(job_id)
+            except sqlite3.Error as e:
+                print(f"Error renewing ingestion job leases: {e}")
+
+    def _run_worker(self):
+        # Each worker keeps one pipeline, and so its API client and connections, across jobs
+        pipeline = None
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                # close() was called, let the MongoDB sink drain before the thread ends
+                try:
+                    if pipeline is not None:
+                        pipeline.close_connections()
+                except Exception as e:
+                    print(f"Error closing ingestion worker: {e}")
+                finally:
+                    self._queue.task_done()
+                return
+
+            if self.quota_exhausted.is_set() or self._stopping.is_set():
+                # Left queued for the next run
+                self._queue.task_done()
+                continue
+
+            try:
+                if pipeline is None:
+                    pipeline = YouTubeDataPipeline(
+                        **self.pipeline_config,
+                        sqlite_connection=self._writer_connection,
+                        sqlite_lock=self._writer_lock,
+                    )
+            except Exception as e:
+                if self.claim_job(job_id) is not None:
+                    self.update_job(job_id, status=FAILED, error=f"Pipeline could not be created: {e}",
+                                    finished_at=utc_now())
+                self._queue.task_done()
+                continue
+
+            try:
+                self.run_job(pipeline, job_id)
+            except Exception as e:
+                print(f"Error in ingestion worker: {e}")
+            finally:
+                self._queue.task_done()
+
+    def claim_job(self, job_id):
+        # Marks a queued job as running, returns (channel_id, incremental, stage, progress, sync_watermark)
+        # or None if another worker has it
+        with self._sqlite_lock, self.sqlite_connection:
+            cursor = self.sqlite_connection.execute(
+                "UPDATE ingestion_jobs SET status = ?, stage = COALESCE(stage, ?), error = NULL, "
+                "started_at = COALESCE(started_at, ?), owner = ?, heartbeat_at = datetime('now') "
+                "WHERE job_id = ? AND status = ?",
+                (RUNNING, JOB_STAGES[0], utc_now(), self.owner, job_id, QUEUED),
+            )
+            if cursor.rowcount != 1:
+                return None
+            return self.sqlite_connection.execute(
+                "SELECT channel_id, incremental, stage, progress, sync_watermark FROM ingestion_jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+
+    def run_job(self, pipeline, job_id):
+        claimed = self.claim_job(job_id)
+        if claimed is None:
+            return
+        channel_id, incremental, stage, progress, sync_watermark = claimed
+
+        # Stages before the checkpoint are already committed
+        first_stage = JOB_STAGES.index(stage)
+
+        with self._progress_lock:
+            self._progress[job_id] = json.loads(progress) if progress else empty_progress()
+        pipeline.incremental = bool(incremental)
+        pipeline.quota_priority = INTERACTIVE_PRIORITY
+
+        def report_progress(stage, pages, rows):
+            self.record_progress(job_id, stage, pages, rows)
+            if self._stopping.is_set():
+                # close(cancel_pending=True): stop at this page or batch, committed batches stay
+                raise JobCancelled(f"Job {job_id} interrupted")
+
+        pipeline.progress_callback = report_progress
+        pipeline.clear_request_cache()
+        if incremental and first_stage > 0:
+            # A completed videos stage has moved the channel's watermark past the new uploads,
+            # the resumed stages work on the uploads after the watermark the job started from
+            pipeline.set_sync_watermark(channel_id, sync_watermark)
+
+        try:
+            pipeline.flush_mongodb_sink()
+        except MongoDBSinkError as e:
+            # Left over from a job of this worker that failed before its writes were flushed
+            print(f"Error in an earlier ingestion job: {e}")
+
+        try:
+            if pipeline.quota_scheduler is not None:
+                # Channels get the quota in the order they started, a new channel waits
+                # while the budget left is only enough to finish the started ones
+                pipeline.quota_priority = pipeline.quota_scheduler.start_channel(
+                    channel_id, resumed=first_stage > 0)
+
+            channels_info = pipeline.get_channels_info([channel_id])
+            if channel_id not in channels_info:
+                raise ValueError(f"Channel {channel_id} could not be looked up")
+            channel_data = channels_info[channel_id]
+            if channel_data is None:
+                raise ValueError(f"Channel {channel_id} could not be found")
+            if first_stage <= 0:
+                pipeline.store_channel_data(channel_id, channel_data)
+                # A stage only counts as done once its MongoDB copy is written too
+                pipeline.flush_mongodb_sink()
+                # The watermark is saved with the checkpoint, see the resume above
+                self.update_job(job_id, stage="videos", channel_name=channel_data["Channel_Name"],
+                                sync_watermark=pipeline.get_sync_watermark(channel_id) if incremental else None)
+
+            if first_stage <= 1:
+                if self.stream_batch_size:
+                    pipeline.stream_videos_data(channel_id, self.stream_batch_size)
+                else:
+                    pipeline.store_videos_data(channel_id, pipeline.get_videos_info(channel_id))
+                pipeline.flush_mongodb_sink()
+
+            self.update_job(job_id, stage="comments")
+            if self.stream_batch_size:
+                pipeline.stream_comments_data(channel_id, self.stream_batch_size)
+            else:
+                pipeline.store_comments_data(channel_id, pipeline.get_comments_info(channel_id))
+            pipeline.flush_mongodb_sink()
+
+            self.update_job(job_id, status=SUCCEEDED, stage=None, finished_at=utc_now())
+        except JobCancelled as e:
+            self.update_job(job_id, status=QUEUED, error=str(e))
+        except QuotaReserveError as e:
+            # Raised before the channel's first request, only this channel waits for the next run
+            if self.stop_on_quota:
+                self.quota_deferred.set()
+                self.update_job(job_id, status=QUEUED, error=str(e))
+            else:
+                self.update_job(job_id, status=FAILED, error=str(e), finished_at=utc_now())
+        except QuotaExceededError as e:
+            if self.stop_on_quota:
+                self.quota_exhausted.set()
+                self.update_job(job_id, status=QUEUED, error=str(e))
+            else:
+                self.update_job(job_id, status=FAILED, error=str(e), finished_at=utc_now())
+        except Exception as e:
+            self.update_job(job_id, status=FAILED, error=str(e), finished_at=utc_now())
+        finally:
+            pipeline.progress_callback = None
+            with self._progress_lock:
+                self._progress.pop(job_id, None)
+
+    def close(self, cancel_pending=False):
+        # Stops the workers once the jobs queued so far are done. With cancel_pending, queued jobs are
+        # left for the next run and running jobs stop at their next page or batch, queued again at their stage.
+        # Either way the workers' pending MongoDB writes are flushed before they exit.
+        if cancel_pending:
+            self._stopping.set()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        # Leases are renewed until the last running job is done
+        self._closed.set()
+        self._heartbeat.join()
+        self._writer_connection.close()
+        self.sqlite_connection.close()
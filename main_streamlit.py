@@ -1,19 +1,111 @@
+import hashlib
+
 import streamlit as st
-import sqlite3
 import pandas as pd
-import pymongo
-import plotly.express as px
-import isodate
-import datetime
-from transformers import pipeline
-import time
 from extra_streamlit_components import tab_bar,TabBarItemData
 from streamlit_shadcn_ui import table
 
-from youtube_data import YouTubeDataPipeline
+from youtube_data import DIRECT_LOAD, YouTubeDataPipeline
+from jobs import IngestionJobQueue
+from quota import QuotaExceededError, QuotaScheduler
+from resilience import CircuitBreaker, CircuitOpenError, RequestMetrics, RetriesExhaustedError
+from sentiment import DEFAULT_BATCH_SIZE
 from visualisations import YouTubeDataVisualisation
 
 
+# Channels ingested at the same time by the background job queue
+INGESTION_WORKERS = 4
+
+
+@st.cache_resource
+def get_quota_scheduler(api_key, sqlite_path):
+    # One quota budget per API key for the whole Streamlit process, the units spent are stored
+    # in the database and shared with ingest_cli runs and restarts on the same quota day
+    return QuotaScheduler(sqlite_path=sqlite_path)
+
+
+@st.cache_resource
+def get_api_health():
+    # Circuit breaker and request metrics shared by every pipeline in the process
+    return CircuitBreaker(), RequestMetrics()
+
+
+@st.cache_resource
+def get_visualisation(sqlite_path):
+    # One SQLite connection for the dashboard queries, kept for the life of the process
+    return YouTubeDataVisualisation(sqlite_path)
+
+
+@st.cache_resource
+def get_youtube_pipeline(api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection,
+                         incremental):
+    # Reuses the discovery client, MongoDB client and SQLite connection across reruns
+    return YouTubeDataPipeline(**pipeline_settings(
+        api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection, incremental))
+
+
+@st.cache_resource
+def get_job_queue(api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection):
+    # Background ingestion workers shared by the sessions using these credentials,
+    # jobs outlive the rerun that queued them
+    return IngestionJobQueue(pipeline_settings(
+        api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection),
+        workers=INGESTION_WORKERS,
+        batch=dashboard_batch(api_key, mongodb_connection_string, mongodb_database, mongodb_collection))
+
+
+def dashboard_batch(api_key, mongodb_connection_string, mongodb_database, mongodb_collection):
+    # Dashboard jobs are grouped by a digest of the credentials they were queued with. A queue only picks
+    # up pending or abandoned jobs of its own batch, so a job always runs with the API key and MongoDB
+    # target of the session that queued it.
+    credentials = "\n".join((api_key, mongodb_connection_string, mongodb_database, mongodb_collection))
+    return "dashboard-" + hashlib.sha256(credentials.encode("utf-8")).hexdigest()[:16]
+
+
+def pipeline_settings(api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection,
+                      incremental=False):
+    # Constructor arguments shared by every YouTubeDataPipeline
+    circuit_breaker, request_metrics = get_api_health()
+    return {
+        "api_key": api_key,
+        "sqlite_path": sqlite_path,
+        "mongodb_connection_string": mongodb_connection_string,
+        "mongodb_database": mongodb_database,
+        "mongodb_collection": mongodb_collection,
+        "response_cache_path": 'youtube_api_cache.sqlite',
+        "quota_scheduler": get_quota_scheduler(api_key, sqlite_path),
+        "circuit_breaker": circuit_breaker,
+        "request_metrics": request_metrics,
+        "load_mode": DIRECT_LOAD,
+        "incremental": incremental,
+    }
+
+
+def format_count(value):
+    # Channel statistics are integers, or None when YouTube hides them
+    return f"{value:,}" if value is not None else "Not Available"
+
+
+@st.fragment(run_every=2)
+def show_ingestion_jobs(job_queue):
+    # Reruns on its own every 2 seconds, the rest of the page is not re-executed
+    jobs = job_queue.jobs()
+    if not jobs:
+        st.write("No ingestion jobs yet.")
+        return
+
+    rows = []
+    for job in jobs:
+        row = {key: job[key] for key in ("job_id", "channel_id", "channel_name", "status", "stage", "error")}
+        for stage, counts in job["progress"].items():
+            row[f"{stage}_pages"] = counts["pages"]
+            row[f"{stage}_rows"] = counts["rows"]
+        row["started_at"] = job["started_at"]
+        row["finished_at"] = job["finished_at"]
+        rows.append(row)
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+
+
 def main():
     st.set_page_config(page_title="Youtube Dashboard",
                        page_icon=":tv:",
@@ -67,8 +159,13 @@ def main():
     # SQLite path
     sqlite_path = 'youtube_data.sqlite'
 
-    # Instantiate the YouTubeDataVisualisation class
-    visualise = YouTubeDataVisualisation(sqlite_path)
+    circuit_breaker, request_metrics = get_api_health()
+    credentials_args = (api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection)
+    # Pipelines and job queues are only built once the credentials are filled in
+    credentials_filled = all((api_key, mongodb_connection_string, mongodb_database, mongodb_collection))
+
+    # Cached YouTubeDataVisualisation instance
+    visualise = get_visualisation(sqlite_path)
 
     st.title('YouTube Dashboard')
 
@@ -107,61 +204,91 @@ def main():
         channel_ids = st.text_area("Enter YouTube channel IDs (comma-separated):")
 
         show_info = st.button("Display Data")
+        incremental = st.checkbox(
+            "Only fetch new uploads (incremental sync)",
+            help="Skip videos and comments that are already stored for the channel")
 
 
+        # Background ingestion, the save buttons only queue jobs
+        job_queue = get_job_queue(*credentials_args) if credentials_filled else None
+
+        if job_queue is None:
+            st.warning("Enter your YouTube API key and MongoDB details in the sidebar, "
+                       "or use the default credentials.")
+
         # If channel IDs are provided
-        if channel_ids or show_info:
+        elif channel_ids or show_info:
             channel_ids = [channel_id.strip() for channel_id in channel_ids.split(",")]
 
             # Create a single info_box for all channels
             info_box = st.container(border=True)
             info_box.subheader("Channel Information")
 
-            
+            # Cached pipeline, API responses are only memoized within this rerun
+            youtube_pipeline = get_youtube_pipeline(*credentials_args, incremental)
+            youtube_pipeline.clear_request_cache()
+
+            try:
+                # One channels.list call per 50 IDs instead of one per channel
+                channels_info = youtube_pipeline.get_channels_info([channel_id for channel_id in channel_ids if channel_id])
+            except (QuotaExceededError, RetriesExhaustedError, CircuitOpenError) as e:
+                # Quota spent, API unreachable or circuit open: every channel below shows as not looked up
+                info_box.error(f"YouTube API request failed: {e}")
+                channels_info = {}
+
             for channel_id in channel_ids:
                 # If channel IDs are provided, execute the pipeline
                 data_box = info_box.container(border=True)  
                 col1, col2 = data_box.columns([4, 2])
 
                 if channel_id:
-                    # Instantiate the YouTubeDataPipeline class
-                    youtube_pipeline = YouTubeDataPipeline(api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection)
-
                     # Get and display channel information
-                    channel_info = youtube_pipeline.get_channel_info(channel_id)
+                    if channel_id not in channels_info:
+                        data_box.error(f"Channel {channel_id} could not be looked up, try again.")
+                        continue
+                    channel_info = channels_info[channel_id]
+                    if channel_info is None:
+                        data_box.error(f"Channel {channel_id} could not be found.")
+                        continue
 
                     col1.write(f"**Channel Name:** {channel_info['Channel_Name']}")
                     col1.write(f"**Channel ID:** {channel_info['Channel_ID']}")
                     data_box.write(f"**Description:** {channel_info['Channel_Description']}")
-                    col2.write(f"**Subscribers:** {channel_info['Subscription_Count']}")
-                    col2.write(f"**Views:** {channel_info['Channel_Views']}")
+                    col2.write(f"**Subscribers:** {format_count(channel_info['Subscription_Count'])}")
+                    col2.write(f"**Views:** {format_count(channel_info['Channel_Views'])}")
                     # Execute the pipeline
                     button_save_data = info_box.button(f"Save Data of {channel_info['Channel_Name']} Channel", key=f"save_data_{channel_id}")
                     info_box.write('\n\n')
                     if button_save_data:
-                        with st.spinner("Executing pipeline..."):
-                            time.sleep(2)  # Simulating pipeline execution time
-                            youtube_pipeline.run_channel_pipeline(channel_id)
-                            youtube_pipeline.run_videos_pipeline(channel_id)
-                            youtube_pipeline.run_comments_pipeline(channel_id)
+                        job_id = job_queue.enqueue(channel_id, incremental)
+                        st.success(f"Ingestion job {job_id} queued for {channel_info['Channel_Name']}.")
 
                         st.markdown(""" **Pipeline involves the following steps:**  
                                         - Extracting data from YouTube  
                                         - Preprocessing data  
-                                        - Storing data in MongoDB  
-                                        - Querying data from MongoDB  
                                         - Creating tables using SQL  
-                                        - Storing data in Database""")
+                                        - Storing data in Database  
+                                        - Storing data in MongoDB in the background""")
 
+            # Queue every listed channel, the workers ingest them concurrently
+            bulk_box = st.container(border=True)
+            button_save_all = bulk_box.button("Save Data of All Channels", key="save_data_all")
+            if button_save_all:
+                job_ids = [job_queue.enqueue(channel_id, incremental) for channel_id in channel_ids if channel_id]
+                bulk_box.success(f"{len(job_ids)} ingestion jobs queued.")
 
-                    
-                    # Close the connections when done with the current channel
-                    youtube_pipeline.close_connections()
+            with st.expander("YouTube API request metrics"):
+                st.write(f"**Circuit breaker:** {circuit_breaker.state}")
+                st.dataframe(pd.DataFrame(request_metrics.snapshot()))
 
         else:
             # If no channel ID is provided, clear the screen
             st.empty()
 
+        if job_queue is not None:
+            with st.expander("Ingestion jobs", expanded=True):
+                show_ingestion_jobs(job_queue)
+
 
     if selected_tab == 'Tables':
         a, b = st.tabs(["Predefined SQL queries charts", "SQL query"])
@@ -194,15 +321,15 @@ def main():
 
 
     elif selected_tab == 'Visualisation':
-        st.set_option('deprecation.showPyplotGlobalUse', False)
+        # Plotly is only loaded once someone opens the charts
+        import plotly.express as px
 
 
         # Bar chart for the number of videos for each channel
         query_num_videos = """
-        SELECT c.channel_name, COUNT(*) AS num_videos
-        FROM channels c
-        INNER JOIN videos v ON v.playlist_id = c.playlist_id
-        GROUP BY c.channel_name
+        SELECT channel_name, num_videos
+        FROM channel_summary
+        WHERE num_videos > 0
         ORDER BY num_videos DESC
         LIMIT 10;
         """
@@ -354,15 +481,14 @@ def main():
         else:
             st.write("You didn't select any Query.")
 
+        batch_size = st.number_input("Sentiment batch size", min_value=1, max_value=256, value=DEFAULT_BATCH_SIZE)
         analyse = st.button('Analyse the Sentiment of the selected comments')
 
         if analyse:
             # Perform sentiment analysis
-            visualise.nlp_analysis(comments_result)
+            visualise.nlp_analysis(comments_result, batch_size=batch_size)
             st.success("Sentiments Analysis Completed.")
 
-    # Close connections
-    visualise.close_connections()
 
 # Run the main script
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+def to_int_or_null(value):
+    # "12345" -> 12345, "Not Available" / "" / None -> None
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        try:
+            return int(float(value))
+        except ValueError:
+            return None
+
+
+def copy_channels_with_typed_statistics(sqlite_connection):
+    rows = sqlite_connection.execute(
+        "SELECT channel_id, channel_name, subscription_count, channel_views, channel_description, playlist_id "
+        "FROM channels"
+    ).fetchall()
+    sqlite_connection.executemany(
+        "INSERT INTO channels_typed VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (channel_id, name, to_int_or_null(subscriptions), to_int_or_null(views), description, playlist_id)
+            for channel_id, name, subscriptions, views, description, playlist_id in rows
+        ],
+    )
+
+
+def add_ingestion_jobs_batch_column(sqlite_connection):
+    # ALTER TABLE ADD COLUMN has no IF NOT EXISTS
+    columns = {row[1] for row in sqlite_connection.execute("PRAGMA table_info(ingestion_jobs)")}
+    if "batch" not in columns:
+        sqlite_connection.execute("ALTER TABLE ingestion_jobs ADD COLUMN batch TEXT")
+
+
+def add_ingestion_jobs_lease_columns(sqlite_connection):
+    columns = {row[1] for row in sqlite_connection.execute("PRAGMA table_info(ingestion_jobs)")}
+    if "owner" not in columns:
+        sqlite_connection.execute("ALTER TABLE ingestion_jobs ADD COLUMN owner TEXT")
+    if "heartbeat_at" not in columns:
+        sqlite_connection.execute("ALTER TABLE ingestion_jobs ADD COLUMN heartbeat_at DATETIME")
+
+
+def add_ingestion_jobs_sync_watermark_column(sqlite_connection):
+    columns = {row[1] for row in sqlite_connection.execute("PRAGMA table_info(ingestion_jobs)")}
+    if "sync_watermark" not in columns:
+        sqlite_connection.execute("ALTER TABLE ingestion_jobs ADD COLUMN sync_watermark DATETIME")
+
+
+# Schema history of the SQLite database. Each migration runs once, in order, inside
+# one transaction, and PRAGMA user_version records the last applied version.
+# A step is either an SQL statement or a callable taking the connection.
+# Never edit a released migration, append a new one instead.
+MIGRATIONS = [
+    (1, "Base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id TEXT PRIMARY KEY,
+            channel_name TEXT,
+            subscription_count INT,
+            channel_views TEXT,
+            channel_description TEXT,
+            playlist_id TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            video_name TEXT,
+            video_description TEXT,
+            tags TEXT,
+            published_at DATETIME,
+            view_count INT,
+            like_count INT,
+            favorite_count INT,
+            comment_count INT,
+            duration TIME,
+            caption BOOLEAN,
+            thumbnail TEXT,
+            playlist_id TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS comments (
+            comment_Id TEXT PRIMARY KEY,
+            video_id TEXT,
+            comment_text TEXT,
+            comment_author TEXT,
+            comment_published_date DATETIME
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS channel_sync_state (
+            channel_id TEXT PRIMARY KEY,
+            playlist_id TEXT,
+            newest_published_at DATETIME,
+            video_count INT,
+            last_synced_at DATETIME
+        )
+        """,
+    ]),
+    (2, "Secondary indexes for dashboard joins and sorts", [
+        "CREATE INDEX IF NOT EXISTS idx_channels_playlist_id ON channels(playlist_id)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_playlist_id ON videos(playlist_id)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_published_at ON videos(published_at)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_view_count ON videos(view_count)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_like_count ON videos(like_count)",
+        "CREATE INDEX IF NOT EXISTS idx_comments_video_id ON comments(video_id)",
+    ]),
+    (3, "Integer channel statistics with NULL for missing values", [
+        """
+        CREATE TABLE channels_typed (
+            channel_id TEXT PRIMARY KEY,
+            channel_name TEXT,
+            subscription_count INTEGER,
+            channel_views INTEGER,
+            channel_description TEXT,
+            playlist_id TEXT
+        )
+        """,
+        copy_channels_with_typed_statistics,
+        "DROP TABLE channels",
+        "ALTER TABLE channels_typed RENAME TO channels",
+        "CREATE INDEX IF NOT EXISTS idx_channels_playlist_id ON channels(playlist_id)",
+        "CREATE INDEX IF NOT EXISTS idx_channels_subscription_count ON channels(subscription_count)",
+    ]),
+    (4, "Materialized dashboard aggregates", [
+        """
+        CREATE TABLE IF NOT EXISTS channel_summary (
+            channel_id TEXT PRIMARY KEY,
+            channel_name TEXT,
+            playlist_id TEXT,
+            subscription_count INTEGER,
+            num_videos INTEGER,
+            total_views INTEGER,
+            total_likes INTEGER,
+            average_duration REAL,
+            num_comments INTEGER,
+            refreshed_at DATETIME
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS video_summary (
+            video_id TEXT PRIMARY KEY,
+            video_name TEXT,
+            channel_id TEXT,
+            channel_name TEXT,
+            num_comments INTEGER,
+            refreshed_at DATETIME
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_channel_summary_num_videos ON channel_summary(num_videos)",
+        "CREATE INDEX IF NOT EXISTS idx_video_summary_channel_id ON video_summary(channel_id)",
+        "CREATE INDEX IF NOT EXISTS idx_video_summary_num_comments ON video_summary(num_comments)",
+        # Summaries of the data stored before this migration, as summaries.refresh_summaries computed them
+        # when it was released. Kept here as a copy so later changes to that module leave this migration alone.
+        """
+        INSERT OR REPLACE INTO channel_summary (
+            channel_id, channel_name, playlist_id, subscription_count, num_videos,
+            total_views, total_likes, average_duration, num_comments, refreshed_at
+        )
+        SELECT
+            c.channel_id,
+            c.channel_name,
+            c.playlist_id,
+            c.subscription_count,
+            COUNT(v.video_id),
+            COALESCE(SUM(v.view_count), 0),
+            COALESCE(SUM(v.like_count), 0),
+            AVG(v.duration),
+            (
+                SELECT COUNT(*) FROM comments cm
+                INNER JOIN videos cv ON cm.video_id = cv.video_id
+                WHERE cv.playlist_id = c.playlist_id
+            ),
+            datetime('now')
+        FROM channels c
+        LEFT JOIN videos v ON v.playlist_id = c.playlist_id
+        GROUP BY c.channel_id
+        """,
+        """
+        INSERT OR REPLACE INTO video_summary (
+            video_id, video_name, channel_id, channel_name, num_comments, refreshed_at
+        )
+        SELECT
+            v.video_id,
+            v.video_name,
+            c.channel_id,
+            c.channel_name,
+            (SELECT COUNT(*) FROM comments cm WHERE cm.video_id = v.video_id),
+            datetime('now')
+        FROM videos v
+        INNER JOIN channels c ON v.playlist_id = c.playlist_id
+        """,
+    ]),
+    (5, "Data version counter for dashboard cache invalidation", [
+        """
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)",
+    ]),
+    (6, "Stored comment sentiment scores per model", [
+        """
+        CREATE TABLE IF NOT EXISTS comment_sentiment (
+            comment_Id TEXT NOT NULL,
+            model TEXT NOT NULL,
+            label TEXT,
+            score REAL,
+            scored_at DATETIME,
+            PRIMARY KEY (comment_Id, model)
+        )
+        """,
+    ]),
+    (7, "Background ingestion jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id TEXT NOT NULL,
+            channel_name TEXT,
+            incremental BOOLEAN NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            stage TEXT,
+            progress TEXT,
+            error TEXT,
+            created_at DATETIME,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs(status)",
+        "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_channel_id ON ingestion_jobs(channel_id)",
+    ]),
+    (8, "Named ingestion batches for resumable command-line runs", [
+        add_ingestion_jobs_batch_column,
+        "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_batch_status ON ingestion_jobs(batch, status)",
+    ]),
+    (9, "Ingestion job leases so several job queues can share a database", [
+        add_ingestion_jobs_lease_columns,
+    ]),
+    (10, "Sync watermark an incremental ingestion job started from", [
+        add_ingestion_jobs_sync_watermark_column,
+    ]),
+    (11, "YouTube API quota units used per quota day", [
+        """
+        CREATE TABLE IF NOT EXISTS quota_usage (
+            day TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            units INTEGER NOT NULL,
+            PRIMARY KEY (day, endpoint)
+        )
+        """,
+    ]),
+]
+
+
+def schema_version(sqlite_connection):
+    return sqlite_connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(sqlite_connection):
+    # Bring the database up to the latest schema version, returns the versions applied
+    applied = []
+
+    for version, description, steps in MIGRATIONS:
+        if version <= schema_version(sqlite_connection):
+            continue
+
+        # BEGIN IMMEDIATE takes the write lock, so concurrent processes migrate one at a time
+        sqlite_connection.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(sqlite_connection):
+                sqlite_connection.execute("COMMIT")
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(sqlite_connection)
+                else:
+                    sqlite_connection.execute(step)
+            sqlite_connection.execute(f"PRAGMA user_version = {version}")
+            sqlite_connection.execute("COMMIT")
+        except Exception:
+            sqlite_connection.execute("ROLLBACK")
+            raise
+
+        print(f"Applied SQLite migration {version}: {description}")
+        applied.append(version)
+
+    return applied
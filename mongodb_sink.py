@@ -0,0 +1,67 @@
+import queue
+import threading
+
+
+class MongoDBSinkError(Exception):
+    pass
+
+
+class MongoDBSink:
+    # Writes batches to MongoDB on a background thread so SQLite loading never waits on the data lake.
+    # Failed writes are collected and raised as MongoDBSinkError from the next flush or close.
+
+    def __init__(self, write_function, max_pending_batches=16):
+        # write_function(collection, documents, key) performs the actual bulk upsert
+        self.write_function = write_function
+        self.errors = []
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mongodb-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                collection, documents, key = item
+                self.write_function(collection, documents, key)
+            except Exception as e:
+                print(f"Error writing to MongoDB: {e}")
+                with self._lock:
+                    self.errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, collection, documents, key):
+        documents = list(documents)
+        if not documents:
+            return
+        self._start()
+        # Blocks when the sink falls too far behind, which bounds memory
+        self._queue.put((collection, documents, key))
+
+    def raise_errors(self):
+        # Each failed write is reported once
+        with self._lock:
+            errors, self.errors = self.errors, []
+        if errors:
+            raise MongoDBSinkError(f"{len(errors)} MongoDB batch writes failed, first error: {errors[0]}")
+
+    def flush(self):
+        if self._thread is not None:
+            self._queue.join()
+        self.raise_errors()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.raise_errors()
@@ -0,0 +1,207 @@
+import datetime
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from migrations import apply_migrations
+
+
+# Quota units charged per call, see https://developers.google.com/youtube/v3/determine_quota_cost
+ENDPOINT_COSTS = {
+    "channels": 1,
+    "playlistItems": 1,
+    "videos": 1,
+    "commentThreads": 1,
+    "search": 100,
+}
+
+# Fraction of the daily budget kept for channels that are already being ingested. New channels
+# are not started below it, so the last units finish started channels instead of leaving several
+# half-ingested ones. Once started, a channel may use the budget down to the last unit.
+START_RESERVE = 0.20
+
+# acquire priority of requests made outside a channel ingest, e.g. dashboard lookups
+INTERACTIVE_PRIORITY = 0
+
+DEFAULT_DAILY_BUDGET = 10000
+
+# quota_usage row that tops the day's usage up to the budget once the API reports quotaExceeded
+EXHAUSTED_ENDPOINT = "quotaExceeded"
+
+# The YouTube Data API quota resets at midnight Pacific time
+try:
+    QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+except ZoneInfoNotFoundError:
+    QUOTA_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-8))
+
+
+class QuotaExceededError(Exception):
+    pass
+
+
+class QuotaReserveError(QuotaExceededError):
+    # The budget left is kept for channels in progress, the daily quota itself is not used up
+    pass
+
+
+def http_error_reason(http_error):
+    # First error reason of a googleapiclient HttpError, e.g. "quotaExceeded"
+    try:
+        content = http_error.content.decode("utf-8") if isinstance(http_error.content, bytes) else http_error.content
+        return json.loads(content)["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+
+def quota_day():
+    return datetime.datetime.now(QUOTA_TIMEZONE).date()
+
+
+class QuotaScheduler:
+    def __init__(self, daily_budget=DEFAULT_DAILY_BUDGET, requests_per_second=10.0, burst=None, used_units=0,
+                 start_reserve=START_RESERVE, sqlite_path=None):
+        self.daily_budget = daily_budget
+        self.start_reserve = start_reserve
+        self.requests_per_second = requests_per_second
+        self.burst = burst if burst is not None else max(1, int(requests_per_second))
+
+        self.day = quota_day()
+        self.used_units = used_units
+        self.usage_by_endpoint = defaultdict(int)
+
+        # Token bucket state, waiting requests are ordered by (priority, arrival)
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+        # Channels are served in the order they were started, see start_channel
+        self._channel_sequence = itertools.count(INTERACTIVE_PRIORITY + 1)
+
+        # With sqlite_path, usage is kept per quota day in the quota_usage table. Reruns on the same day and
+        # every process using the database, e.g. the dashboard and ingest_cli, then spend one budget.
+        self.sqlite_connection = None
+        if sqlite_path is not None:
+            self.sqlite_connection = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self.sqlite_connection.execute("PRAGMA busy_timeout=30000")
+            apply_migrations(self.sqlite_connection)
+            self._load_usage()
+
+    @property
+    def remaining_units(self):
+        return max(0, self.daily_budget - self.used_units)
+
+    def status(self):
+        with self._condition:
+            self._reset_if_new_day()
+            return {
+                "day": self.day.isoformat(),
+                "used_units": self.used_units,
+                "remaining_units": self.remaining_units,
+                "usage_by_endpoint": dict(self.usage_by_endpoint),
+            }
+
+    def mark_exhausted(self):
+        # The API reported quotaExceeded, trust it over our own accounting
+        with self._condition:
+            self._reset_if_new_day()
+            self._record_usage(EXHAUSTED_ENDPOINT, max(0, self.daily_budget - self.used_units))
+            self.used_units = max(self.used_units, self.daily_budget)
+            self._condition.notify_all()
+
+    def _reset_if_new_day(self):
+        today = quota_day()
+        if today != self.day:
+            self.day = today
+            self.used_units = 0
+            self.usage_by_endpoint.clear()
+            if self.sqlite_connection is not None:
+                self._load_usage()
+
+    def _load_usage(self):
+        # Units recorded today by every scheduler sharing the database, including this one
+        rows = self.sqlite_connection.execute(
+            "SELECT endpoint, units FROM quota_usage WHERE day = ?", (self.day.isoformat(),)).fetchall()
+        for endpoint, units in rows:
+            self.usage_by_endpoint[endpoint] = max(self.usage_by_endpoint[endpoint], units)
+        self.used_units = max(self.used_units, sum(units for _, units in rows))
+
+    def _record_usage(self, endpoint, units):
+        if self.sqlite_connection is None or units <= 0:
+            return
+        try:
+            with self.sqlite_connection:
+                self.sqlite_connection.execute(
+                    "INSERT INTO quota_usage (day, endpoint, units) VALUES (?, ?, ?) "
+                    "ON CONFLICT (day, endpoint) DO UPDATE SET units = units + excluded.units",
+                    (self.day.isoformat(), endpoint, units),
+                )
+            # Picks up the units other processes spent since the last request
+            self._load_usage()
+        except sqlite3.Error as e:
+            print(f"Error recording YouTube API quota usage: {e}")
+
+    def _check_budget(self, endpoint, cost):
+        if self.remaining_units < cost:
+            raise QuotaExceededError(
+                f"Daily quota budget used up, {endpoint} request refused "
+                f"({self.remaining_units} of {self.daily_budget} units left)"
+            )
+
+    def start_channel(self, channel_id, resumed=False):
+        # Call before ingesting a channel, returns the priority to pass to acquire for its requests.
+        # Channels started earlier are served first. A new channel is refused with QuotaReserveError
+        # while the budget left is reserved for the started ones, a resumed channel is never refused.
+        with self._condition:
+            self._reset_if_new_day()
+            if self.remaining_units <= 0:
+                raise QuotaExceededError(f"Daily quota budget used up, channel {channel_id} not started")
+            if not resumed and self.remaining_units < self.start_reserve * self.daily_budget:
+                raise QuotaReserveError(
+                    f"Channel {channel_id} not started, the remaining {self.remaining_units} of "
+                    f"{self.daily_budget} units are reserved for channels in progress"
+                )
+            return next(self._channel_sequence)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.requests_per_second)
+        self._last_refill = now
+
+    def acquire(self, endpoint, priority=INTERACTIVE_PRIORITY):
+        # Block until the rate limit allows the request, then charge its quota cost.
+        # Waiting requests with a lower priority value go first, see start_channel.
+        cost = ENDPOINT_COSTS.get(endpoint, 1)
+
+        with self._condition:
+            self._reset_if_new_day()
+            self._check_budget(endpoint, cost)
+
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiting[0] == ticket and self._tokens >= 1:
+                        break
+                    timeout = None
+                    if self._waiting[0] == ticket:
+                        timeout = (1 - self._tokens) / self.requests_per_second
+                    self._condition.wait(timeout)
+
+                # The budget may have been spent by others while we waited
+                self._check_budget(endpoint, cost)
+                self._tokens -= 1
+                self.used_units += cost
+                self.usage_by_endpoint[endpoint] += cost
+                self._record_usage(endpoint, cost)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
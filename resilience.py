@@ -0,0 +1,126 @@
+import random
+import socket
+import ssl
+import threading
+import time
+from collections import defaultdict
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from quota import http_error_reason
+
+
+# HTTP statuses and 403 reasons worth retrying, everything else is fatal
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "backendError", "internalError"}
+RETRYABLE_EXCEPTIONS = (ConnectionError, TimeoutError, socket.timeout, ssl.SSLError, httplib2.HttpLib2Error)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetriesExhaustedError(Exception):
+    pass
+
+
+def is_not_modified(error):
+    return isinstance(error, HttpError) and error.resp.status == 304
+
+
+def is_retryable(error):
+    if isinstance(error, HttpError):
+        if error.resp.status in RETRYABLE_STATUSES:
+            return True
+        return error.resp.status == 403 and http_error_reason(error) in RETRYABLE_REASONS
+    return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=32.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+
+            # Half open lets a single trial request through
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+
+            raise CircuitOpenError(
+                f"YouTube API circuit open after {self.consecutive_failures} consecutive failures"
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(lambda: {
+            "requests": 0,
+            "failures": 0,
+            "retries": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+        })
+
+    def record(self, endpoint, latency, failed=False):
+        with self._lock:
+            metrics = self._endpoints[endpoint]
+            metrics["requests"] += 1
+            metrics["failures"] += int(failed)
+            metrics["total_latency"] += latency
+            metrics["max_latency"] = max(metrics["max_latency"], latency)
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._endpoints[endpoint]["retries"] += 1
+
+    def snapshot(self):
+        # One row per endpoint, latencies in seconds
+        with self._lock:
+            return [
+                {
+                    "endpoint": endpoint,
+                    **metrics,
+                    "avg_latency": metrics["total_latency"] / metrics["requests"] if metrics["requests"] else 0.0,
+                }
+                for endpoint, metrics in sorted(self._endpoints.items())
+            ]
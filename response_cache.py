@@ -0,0 +1,104 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+
+# Seconds a cached response is served without contacting the API, per endpoint.
+# Endpoints missing from the mapping are never cached.
+DEFAULT_TTLS = {
+    "channels": 6 * 60 * 60,
+    "playlistItems": 30 * 60,
+    "videos": 10 * 60,
+    "commentThreads": 15 * 60,
+}
+
+# Entries older than this are dropped when the cache is opened
+MAX_ENTRY_AGE = 7 * 24 * 60 * 60
+
+
+def endpoint_name(uri):
+    # https://youtube.googleapis.com/youtube/v3/videos?... -> "videos"
+    return urllib.parse.urlsplit(uri).path.rstrip("/").rsplit("/", 1)[-1]
+
+
+def cache_key(uri):
+    # The API key is left out so every key shares the same entries
+    parts = urllib.parse.urlsplit(uri)
+    params = sorted(
+        (name, value) for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if name != "key"
+    )
+    normalized = f"{parts.path}?{urllib.parse.urlencode(params)}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    def __init__(self, response, etag, fresh):
+        self.response = response
+        self.etag = etag
+        self.fresh = fresh
+
+
+class ResponseCache:
+    def __init__(self, path, ttls=None):
+        self.path = path
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS api_responses (
+                cache_key TEXT PRIMARY KEY,
+                endpoint TEXT,
+                etag TEXT,
+                response TEXT,
+                fetched_at REAL
+            )
+            """
+        )
+        self.connection.execute("DELETE FROM api_responses WHERE fetched_at < ?", (time.time() - MAX_ENTRY_AGE,))
+        self.connection.commit()
+
+    def cacheable(self, uri):
+        return endpoint_name(uri) in self.ttls
+
+    def get(self, uri):
+        if not self.cacheable(uri):
+            return None
+
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT etag, response, fetched_at FROM api_responses WHERE cache_key = ?", (cache_key(uri),)
+            ).fetchone()
+        if row is None:
+            return None
+
+        etag, response, fetched_at = row
+        fresh = time.time() - fetched_at < self.ttls[endpoint_name(uri)]
+        return CachedResponse(json.loads(response), etag, fresh)
+
+    def put(self, uri, response):
+        if not self.cacheable(uri):
+            return
+
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO api_responses (cache_key, endpoint, etag, response, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (cache_key(uri), endpoint_name(uri), response.get("etag"), json.dumps(response), time.time()),
+            )
+            self.connection.commit()
+
+    def touch(self, uri):
+        # A 304 Not Modified revalidates the entry for another TTL period
+        with self._lock:
+            self.connection.execute(
+                "UPDATE api_responses SET fetched_at = ? WHERE cache_key = ?", (time.time(), cache_key(uri))
+            )
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,101 @@
+import functools
+import time
+
+
+# Same model the "sentiment-analysis" task defaults to, pinned so scores stay comparable
+DEFAULT_SENTIMENT_MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+DEFAULT_BATCH_SIZE = 32
+
+# Tokenizers without a configured limit report a huge sentinel value
+FALLBACK_MAX_LENGTH = 512
+
+
+# SQLite limits the number of bound parameters per statement
+SCORE_LOOKUP_CHUNK = 500
+
+
+class SentimentEngine:
+    def __init__(self, model_name=DEFAULT_SENTIMENT_MODEL, batch_size=DEFAULT_BATCH_SIZE, revision=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        # Stored scores are keyed by model_id, so a new model or revision scores everything again
+        self.model_id = f"{model_name}@{revision}" if revision else model_name
+        # transformers pulls in torch or TensorFlow, so it is imported on first use rather than at app start
+        from transformers import pipeline
+
+        self.classifier = pipeline("sentiment-analysis", model=model_name, revision=revision)
+
+        max_length = getattr(self.classifier.tokenizer, "model_max_length", FALLBACK_MAX_LENGTH)
+        self.max_length = max_length if max_length <= 100_000 else FALLBACK_MAX_LENGTH
+
+        # Throughput of the last classify call
+        self.last_stats = {}
+
+    def classify(self, texts, batch_size=None):
+        # Returns one {"label", "score"} dict per text, in input order
+        batch_size = batch_size or self.batch_size
+        texts = ["" if text is None else str(text) for text in texts]
+        started = time.perf_counter()
+
+        # Identical texts are scored once, similar lengths in a batch keep padding to a minimum
+        unique_texts = sorted(set(texts), key=len)
+        scores = {}
+
+        for start in range(0, len(unique_texts), batch_size):
+            batch = unique_texts[start:start + batch_size]
+            outputs = self.classifier(
+                batch,
+                batch_size=batch_size,
+                truncation=True,
+                max_length=self.max_length,
+            )
+            scores.update(zip(batch, outputs))
+
+        seconds = time.perf_counter() - started
+        self.last_stats = {
+            "texts": len(texts),
+            "unique_texts": len(unique_texts),
+            "seconds": seconds,
+            "texts_per_second": len(unique_texts) / seconds if seconds > 0 else float(len(unique_texts)),
+        }
+        return [scores[text] for text in texts]
+
+
+@functools.lru_cache(maxsize=None)
+def get_sentiment_engine(model_name=DEFAULT_SENTIMENT_MODEL):
+    # The model is loaded once per process and reused by every analysis
+    return SentimentEngine(model_name)
+
+
+def load_sentiment_scores(sqlite_connection, comment_ids, model_id):
+    # {comment_Id: {"label", "score"}} for the comments already scored by this model
+    comment_ids = list(dict.fromkeys(comment_ids))
+    scores = {}
+
+    for start in range(0, len(comment_ids), SCORE_LOOKUP_CHUNK):
+        chunk = comment_ids[start:start + SCORE_LOOKUP_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = sqlite_connection.execute(
+            f"SELECT comment_Id, label, score FROM comment_sentiment "
+            f"WHERE model = ? AND comment_Id IN ({placeholders})",
+            [model_id, *chunk],
+        )
+        for comment_id, label, score in rows:
+            scores[comment_id] = {"label": label, "score": score}
+
+    return scores
+
+
+def save_sentiment_scores(sqlite_connection, scores, model_id):
+    # scores: {comment_Id: {"label", "score"}}, runs in the caller's transaction
+    sqlite_connection.executemany(
+        """
+        INSERT INTO comment_sentiment (comment_Id, model, label, score, scored_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(comment_Id, model) DO UPDATE SET
+            label = excluded.label,
+            score = excluded.score,
+            scored_at = excluded.scored_at
+        """,
+        [(comment_id, model_id, score["label"], score["score"]) for comment_id, score in scores.items()],
+    )
@@ -0,0 +1,70 @@
+import argparse
+import subprocess
+import sys
+import time
+
+
+# Modules the dashboard imports on a cold start, in import order
+DEFAULT_MODULES = ("main_streamlit",)
+
+# Imports that should only load when their tab or feature is first used.
+# Streamlit itself imports plotly.graph_objects, so only plotly.express is checked.
+LAZY_MODULES = ("transformers", "torch", "tensorflow", "matplotlib", "plotly.express")
+
+
+def profile_imports(modules):
+    # Imports the modules in a fresh interpreter with -X importtime.
+    # Returns the wall-clock seconds and [(cumulative_us, self_us, module)] for every import.
+    code = "; ".join(f"import {module}" for module in modules)
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True,
+    )
+    seconds = time.perf_counter() - started
+    if completed.returncode != 0:
+        errors = "\n".join(line for line in completed.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"Importing {', '.join(modules)} failed:\n{errors}")
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+        # Nested imports are indented below the module that imported them
+        imports.append((int(cumulative_us), int(self_us), module[1:].rstrip()))
+
+    return seconds, imports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of the dashboard.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=20, help="slowest top-level imports to list (default: 20)")
+    parser.add_argument("--budget", type=float,
+                        help="fail when the import takes longer than this many seconds")
+    args = parser.parse_args(argv)
+
+    seconds, imports = profile_imports(args.modules)
+
+    # Top-level imports only, nested ones are included in their parent's cumulative time
+    top_level = [entry for entry in imports if not entry[2].startswith(" ")]
+    print(f"Imported {', '.join(args.modules)} in {seconds:.2f}s ({len(imports)} modules)")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, module in sorted(top_level, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1e6:>11.3f}s {self_us / 1e6:>9.3f}s  {module.strip()}")
+
+    loaded_lazy_modules = sorted({module.strip() for _, _, module in imports if module.strip() in LAZY_MODULES})
+    status = 0
+    if loaded_lazy_modules:
+        print(f"Loaded at startup but expected to be lazy: {', '.join(loaded_lazy_modules)}")
+        status = 1
+    if args.budget is not None and seconds > args.budget:
+        print(f"Startup import time {seconds:.2f}s is over the {args.budget:.2f}s budget")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# Aggregate tables read by the dashboard instead of recomputing GROUP BY joins on every rerun.
+# The pipeline refreshes only the channels touched by an ingest, inside the same transaction.
+
+CHANNEL_SUMMARY_REFRESH = """
+    INSERT OR REPLACE INTO channel_summary (
+        channel_id, channel_name, playlist_id, subscription_count, num_videos,
+        total_views, total_likes, average_duration, num_comments, refreshed_at
+    )
+    SELECT
+        c.channel_id,
+        c.channel_name,
+        c.playlist_id,
+        c.subscription_count,
+        COUNT(v.video_id),
+        COALESCE(SUM(v.view_count), 0),
+        COALESCE(SUM(v.like_count), 0),
+        AVG(v.duration),
+        (
+            SELECT COUNT(*) FROM comments cm
+            INNER JOIN videos cv ON cm.video_id = cv.video_id
+            WHERE cv.playlist_id = c.playlist_id
+        ),
+        datetime('now')
+    FROM channels c
+    LEFT JOIN videos v ON v.playlist_id = c.playlist_id
+    WHERE c.channel_id = ?
+    GROUP BY c.channel_id
+"""
+
+VIDEO_SUMMARY_REFRESH = """
+    INSERT OR REPLACE INTO video_summary (
+        video_id, video_name, channel_id, channel_name, num_comments, refreshed_at
+    )
+    SELECT
+        v.video_id,
+        v.video_name,
+        c.channel_id,
+        c.channel_name,
+        (SELECT COUNT(*) FROM comments cm WHERE cm.video_id = v.video_id),
+        datetime('now')
+    FROM videos v
+    INNER JOIN channels c ON v.playlist_id = c.playlist_id
+    WHERE c.channel_id = ?
+"""
+
+
+def refresh_summaries(sqlite_connection, channel_ids=None):
+    # Recompute the summary rows of the given channels, or of every channel when None.
+    # Runs in the caller's transaction.
+    if channel_ids is None:
+        channel_ids = [row[0] for row in sqlite_connection.execute("SELECT channel_id FROM channels")]
+
+    for channel_id in channel_ids:
+        sqlite_connection.execute("DELETE FROM channel_summary WHERE channel_id = ?", (channel_id,))
+        sqlite_connection.execute("DELETE FROM video_summary WHERE channel_id = ?", (channel_id,))
+        sqlite_connection.execute(CHANNEL_SUMMARY_REFRESH, (channel_id,))
+        sqlite_connection.execute(VIDEO_SUMMARY_REFRESH, (channel_id,))
+
+
+def bump_data_version(sqlite_connection):
+    # Called in every ingest transaction, dashboard query caches are keyed on the version
+    sqlite_connection.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+
+def read_data_version(sqlite_connection):
+    row = sqlite_connection.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to main_streamlit.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import youtube_data  # noqa: E402
+from fake_youtube import FakeYouTube  # noqa: E402
+
+
+@pytest.fixture
+def fake_youtube(monkeypatch):
+    service = FakeYouTube()
+    monkeypatch.setattr(youtube_data, "get_youtube_service", lambda api_key: service)
+    return service
+
+
+@pytest.fixture
+def pipeline_config(tmp_path, fake_youtube):
+    # Direct load without the MongoDB sink, the client is created but never connects
+    return {
+        "api_key": "test-key",
+        "sqlite_path": str(tmp_path / "youtube_data.sqlite"),
+        "mongodb_connection_string": "mongodb://localhost:27017/?serverSelectionTimeoutMS=100",
+        "mongodb_database": "test",
+        "mongodb_collection": "youtube_data",
+        "load_mode": youtube_data.DIRECT_LOAD,
+        "mongodb_sink": False,
+    }
@@ -0,0 +1,130 @@
+import datetime
+import threading
+import urllib.parse
+
+
+class FakeRequest:
+    def __init__(self, service, resource, params):
+        self.service = service
+        self.resource = resource
+        self.params = params
+        self.uri = (f"https://youtube.googleapis.com/youtube/v3/{resource}?"
+                    f"{urllib.parse.urlencode(sorted(params.items()))}")
+        self.method = "GET"
+        self.headers = {}
+
+    def execute(self, http=None, num_retries=0):
+        return self.service.handle(self.resource, self.params)
+
+
+class FakeResource:
+    def __init__(self, service, name):
+        self.service = service
+        self.name = name
+
+    def list(self, **params):
+        return FakeRequest(self.service, self.name, {key: value for key, value in params.items() if value is not None})
+
+
+class FakeYouTube:
+    # Stands in for the googleapiclient service: channels, uploads playlists, videos and comments in memory
+
+    def __init__(self, comments_per_video=3):
+        self.comments_per_video = comments_per_video
+        # {channel_id: [video_id, ...]} newest first, like the uploads playlist
+        self.uploads = {}
+        self.published_at = {}
+        self.calls = []
+        # Optional fail(resource, params), raise from it to interrupt a run
+        self.fail = None
+        self._lock = threading.Lock()
+
+    def add_channel(self, channel_id, video_count, first_published=datetime.datetime(2024, 1, 1)):
+        self.uploads[channel_id] = []
+        for index in range(video_count):
+            self.upload(channel_id, first_published + datetime.timedelta(days=index))
+
+    def upload(self, channel_id, published_at):
+        # New uploads go to the front of the playlist
+        video_id = f"{channel_id}-v{len(self.published_at):04d}"
+        self.uploads[channel_id].insert(0, video_id)
+        self.published_at[video_id] = published_at.strftime("%Y-%m-%dT%H:%M:%SZ")
+        return video_id
+
+    def calls_to(self, resource):
+        return [params for called, params in self.calls if called == resource]
+
+    def channels(self):
+        return FakeResource(self, "channels")
+
+    def playlistItems(self):
+        return FakeResource(self, "playlistItems")
+
+    def videos(self):
+        return FakeResource(self, "videos")
+
+    def commentThreads(self):
+        return FakeResource(self, "commentThreads")
+
+    def handle(self, resource, params):
+        with self._lock:
+            self.calls.append((resource, dict(params)))
+        if self.fail is not None:
+            self.fail(resource, params)
+
+        if resource == "channels":
+            return {"items": [
+                {
+                    "id": channel_id,
+                    "snippet": {"title": f"Channel {channel_id}", "description": ""},
+                    "statistics": {"subscriberCount": "10", "viewCount": "100"},
+                    "contentDetails": {"relatedPlaylists": {"uploads": f"UU{channel_id}"}},
+                }
+                for channel_id in params["id"].split(",") if channel_id in self.uploads
+            ]}
+
+        if resource == "playlistItems":
+            video_ids = self.uploads[params["playlistId"][2:]]
+            start = int(params.get("pageToken", 0))
+            end = start + params["maxResults"]
+            response = {"items": [
+                {"contentDetails": {"videoId": video_id, "videoPublishedAt": self.published_at[video_id]}}
+                for video_id in video_ids[start:end]
+            ]}
+            if end < len(video_ids):
+                response["nextPageToken"] = str(end)
+            return response
+
+        if resource == "videos":
+            assert "maxResults" not in params
+            return {"items": [
+                {
+                    "id": video_id,
+                    "snippet": {
+                        "title": f"Video {video_id}",
+                        "publishedAt": self.published_at[video_id],
+                        "thumbnails": {"default": {"url": "https://i.ytimg.com/default.jpg"}},
+                    },
+                    "statistics": {"viewCount": "5", "likeCount": "1", "commentCount": str(self.comments_per_video)},
+                    "contentDetails": {"duration": "PT1M"},
+                }
+                for video_id in params["id"].split(",") if video_id in self.published_at
+            ]}
+
+        if resource == "commentThreads":
+            video_id = params["videoId"]
+            start = int(params.get("pageToken", 0))
+            end = min(start + params["maxResults"], self.comments_per_video)
+            response = {"items": [
+                {"snippet": {"topLevelComment": {"id": f"{video_id}-c{index}", "snippet": {
+                    "textDisplay": f"Comment {index}",
+                    "authorDisplayName": "Viewer",
+                    "publishedAt": self.published_at[video_id],
+                }}}}
+                for index in range(start, end)
+            ]}
+            if end < self.comments_per_video:
+                response["nextPageToken"] = str(end)
+            return response
+
+        raise ValueError(f"Unexpected resource {resource}")
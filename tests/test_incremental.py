@@ -0,0 +1,114 @@
+import datetime
+import sqlite3
+
+from jobs import QUEUED, SUCCEEDED, IngestionJobQueue
+from quota import QuotaExceededError
+from test_jobs import run_until_idle, stored_jobs
+import youtube_data
+from youtube_data import YouTubeDataPipeline
+
+
+def ingest(pipeline, channel_id):
+    pipeline.clear_request_cache()
+    pipeline.store_channel_data(channel_id, pipeline.get_channel_info(channel_id))
+    pipeline.store_videos_data(channel_id, pipeline.get_videos_info(channel_id))
+    pipeline.store_comments_data(channel_id, pipeline.get_comments_info(channel_id))
+
+
+def count_rows(sqlite_path, table):
+    with sqlite3.connect(sqlite_path) as sqlite_connection:
+        return sqlite_connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_incremental_sync_fetches_uploads_published_after_the_watermark(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 120)
+    pipeline = YouTubeDataPipeline(**pipeline_config)
+    assert pipeline.get_sync_watermark("UC1") is None
+    ingest(pipeline, "UC1")
+
+    new_ids = [fake_youtube.upload("UC1", datetime.datetime(2025, 1, day)) for day in (1, 2)]
+    pipeline.incremental = True
+    fake_youtube.calls.clear()
+    ingest(pipeline, "UC1")
+
+    # The run keeps the watermark it started from, the stored one has moved to the newest upload
+    assert pipeline.get_sync_watermark("UC1") == "2024-04-29 00:00:00"
+    assert sorted(pipeline.get_new_video_ids("UC1")) == sorted(new_ids)
+    # The first playlist page already reaches back to the watermark
+    assert len(fake_youtube.calls_to("playlistItems")) == 1
+    assert len(fake_youtube.calls_to("commentThreads")) == 2
+    assert count_rows(pipeline_config["sqlite_path"], "videos") == 122
+
+    pipeline.clear_request_cache()
+    assert pipeline.get_sync_watermark("UC1") == "2025-01-02 00:00:00"
+    pipeline.close_connections()
+
+
+def test_resumed_incremental_job_loads_comments_of_the_new_uploads(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 3)
+    job_queue = IngestionJobQueue(pipeline_config, workers=1, batch="daily", stop_on_quota=True)
+    job_queue.enqueue("UC1")
+    run_until_idle(job_queue)
+
+    # The quota runs out in the comments stage of the next incremental run
+    new_ids = [fake_youtube.upload("UC1", datetime.datetime(2025, 1, day)) for day in (1, 2)]
+
+    def quota_exceeded(resource, params):
+        if resource == "commentThreads":
+            raise QuotaExceededError("YouTube API quota exhausted: quotaExceeded")
+
+    fake_youtube.fail = quota_exceeded
+    job_queue.enqueue("UC1", incremental=True)
+    run_until_idle(job_queue)
+    job_queue.close()
+    assert stored_jobs(pipeline_config["sqlite_path"]) == {"UC1": (QUEUED, "comments")}
+    assert count_rows(pipeline_config["sqlite_path"], "videos") == 5
+
+    # The videos stage is done and has moved the channel watermark, the resumed job still knows the new uploads
+    fake_youtube.fail = None
+    fake_youtube.calls.clear()
+    job_queue = IngestionJobQueue(pipeline_config, workers=1, batch="daily", stop_on_quota=True)
+    run_until_idle(job_queue)
+    job_queue.close()
+
+    assert sorted(params["videoId"] for params in fake_youtube.calls_to("commentThreads")) == sorted(new_ids)
+    assert count_rows(pipeline_config["sqlite_path"], "comments") == 5 * fake_youtube.comments_per_video
+    assert stored_jobs(pipeline_config["sqlite_path"]) == {"UC1": (SUCCEEDED, None)}
+
+
+def test_interrupted_streamed_videos_stage_keeps_the_older_new_uploads(
+        pipeline_config, fake_youtube, monkeypatch):
+    fake_youtube.add_channel("UC1", 3)
+    job_queue = IngestionJobQueue(pipeline_config, workers=1, batch="daily", stop_on_quota=True,
+                                  stream_batch_size=2)
+    job_queue.enqueue("UC1")
+    run_until_idle(job_queue)
+
+    # Two videos per videos.list call and per committed batch, the quota runs out after the newest two
+    monkeypatch.setattr(youtube_data, "VIDEOS_PER_REQUEST", 2)
+    new_ids = [fake_youtube.upload("UC1", datetime.datetime(2025, 1, day)) for day in range(1, 6)]
+    videos_calls = []
+
+    def quota_exceeded(resource, params):
+        if resource == "videos":
+            videos_calls.append(params)
+            if len(videos_calls) == 2:
+                raise QuotaExceededError("YouTube API quota exhausted: quotaExceeded")
+
+    fake_youtube.fail = quota_exceeded
+    job_queue.enqueue("UC1", incremental=True)
+    run_until_idle(job_queue)
+    job_queue.close()
+    assert stored_jobs(pipeline_config["sqlite_path"]) == {"UC1": (QUEUED, "videos")}
+    assert count_rows(pipeline_config["sqlite_path"], "videos") == 5
+
+    fake_youtube.fail = None
+    fake_youtube.calls.clear()
+    job_queue = IngestionJobQueue(pipeline_config, workers=1, batch="daily", stop_on_quota=True,
+                                  stream_batch_size=2)
+    run_until_idle(job_queue)
+    job_queue.close()
+
+    assert count_rows(pipeline_config["sqlite_path"], "videos") == 8
+    assert sorted(params["videoId"] for params in fake_youtube.calls_to("commentThreads")) == sorted(new_ids)
+    assert stored_jobs(pipeline_config["sqlite_path"]) == {"UC1": (SUCCEEDED, None)}
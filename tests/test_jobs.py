@@ -0,0 +1,166 @@
+import json
+import sqlite3
+import threading
+import time
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, IngestionJobQueue, empty_progress
+from migrations import apply_migrations
+from quota import QuotaScheduler
+
+
+def add_job(sqlite_path, channel_id, stage=None, batch="test", status=QUEUED, heartbeat_at=None):
+    with sqlite3.connect(sqlite_path) as sqlite_connection:
+        apply_migrations(sqlite_connection)
+        sqlite_connection.execute(
+            "INSERT INTO ingestion_jobs (channel_id, status, stage, progress, created_at, batch, heartbeat_at) "
+            "VALUES (?, ?, ?, ?, datetime('now'), ?, ?)",
+            (channel_id, status, stage, json.dumps(empty_progress()), batch, heartbeat_at),
+        )
+
+
+def stored_jobs(sqlite_path):
+    # {channel_id: (status, stage)} as left in the database
+    with sqlite3.connect(sqlite_path) as sqlite_connection:
+        rows = sqlite_connection.execute(
+            "SELECT channel_id, status, stage FROM ingestion_jobs ORDER BY job_id").fetchall()
+    return {channel_id: (status, stage) for channel_id, status, stage in rows}
+
+
+def job_statuses(job_queue):
+    return {job["channel_id"]: job["status"] for job in job_queue.jobs()}
+
+
+def run_until_idle(job_queue, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not job_queue.idle():
+        assert time.monotonic() < deadline, "jobs did not finish"
+        time.sleep(0.05)
+
+
+def test_reserve_refusal_does_not_stop_started_channels(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 5)
+    fake_youtube.add_channel("UC2", 5)
+    # UC1 is new, UC2 stopped in its comments stage during an earlier run
+    add_job(pipeline_config["sqlite_path"], "UC1")
+    add_job(pipeline_config["sqlite_path"], "UC2", stage="comments")
+
+    # 15 units left, below the 20 unit reserve but enough to finish UC2
+    pipeline_config["quota_scheduler"] = QuotaScheduler(daily_budget=100, requests_per_second=1000, used_units=85)
+    job_queue = IngestionJobQueue(pipeline_config, workers=1, batch="test", stop_on_quota=True)
+    run_until_idle(job_queue)
+
+    assert job_statuses(job_queue) == {"UC1": QUEUED, "UC2": SUCCEEDED}
+    assert job_queue.quota_deferred.is_set()
+    assert not job_queue.quota_exhausted.is_set()
+    job_queue.close()
+
+
+def test_job_fails_when_the_mongodb_sink_cannot_write(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 2)
+    # Nothing listens on the configured MongoDB address
+    pipeline_config["mongodb_sink"] = True
+
+    job_queue = IngestionJobQueue(pipeline_config, workers=1)
+    job_queue.enqueue("UC1")
+    run_until_idle(job_queue)
+
+    job = job_queue.jobs()[0]
+    assert job["status"] == FAILED
+    assert "MongoDB" in job["error"]
+    # The checkpoint stays at the stage whose MongoDB copy is missing
+    assert job["stage"] == "channels"
+    job_queue.close()
+
+
+def test_cancelled_job_is_queued_again_at_its_stage(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 6)
+    fake_youtube.add_channel("UC2", 2)
+    job_queue = IngestionJobQueue(pipeline_config, workers=1, stream_batch_size=2)
+    closing = []
+
+    def interrupt(resource, params):
+        # Ctrl-C in ingest_cli while the first comments are fetched
+        if resource == "commentThreads" and not closing:
+            closing.append(threading.Thread(target=job_queue.close, kwargs={"cancel_pending": True}))
+            closing[0].start()
+            time.sleep(0.1)
+
+    fake_youtube.fail = interrupt
+    job_queue.enqueue_many(["UC1", "UC2"])
+    closing_deadline = time.monotonic() + 30
+    while not closing and time.monotonic() < closing_deadline:
+        time.sleep(0.05)
+    closing[0].join(timeout=30)
+
+    assert stored_jobs(pipeline_config["sqlite_path"]) == {"UC1": (QUEUED, "comments"), "UC2": (QUEUED, None)}
+
+
+def test_running_job_of_a_live_queue_is_not_taken_over(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 2)
+    release = threading.Event()
+
+    def hold_comments(resource, params):
+        if resource == "commentThreads":
+            release.wait(30)
+
+    fake_youtube.fail = hold_comments
+    first_queue = IngestionJobQueue(pipeline_config, workers=1, lease_timeout=1)
+    first_queue.enqueue("UC1")
+    while stored_jobs(pipeline_config["sqlite_path"])["UC1"] != (RUNNING, "comments"):
+        time.sleep(0.05)
+
+    # A second process starts on the same database while the first one still works on the job
+    second_queue = IngestionJobQueue(pipeline_config, workers=1, lease_timeout=1)
+    time.sleep(1.5)
+    assert stored_jobs(pipeline_config["sqlite_path"])["UC1"] == (RUNNING, "comments")
+
+    release.set()
+    run_until_idle(first_queue)
+    run_until_idle(second_queue)
+    assert stored_jobs(pipeline_config["sqlite_path"])["UC1"] == (SUCCEEDED, None)
+    assert len(fake_youtube.calls_to("channels")) == 1
+    first_queue.close()
+    second_queue.close()
+
+
+def test_abandoned_running_job_is_queued_again(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 2)
+    add_job(pipeline_config["sqlite_path"], "UC1", stage="videos", batch=None, status=RUNNING,
+            heartbeat_at="2024-01-01 00:00:00")
+
+    job_queue = IngestionJobQueue(pipeline_config, workers=1)
+    run_until_idle(job_queue)
+    assert stored_jobs(pipeline_config["sqlite_path"])["UC1"] == (SUCCEEDED, None)
+    job_queue.close()
+
+
+def test_workers_share_one_serialized_writer(pipeline_config, fake_youtube):
+    channel_ids = [f"UC{index}" for index in range(4)]
+    for channel_id in channel_ids:
+        fake_youtube.add_channel(channel_id, 5)
+
+    job_queue = IngestionJobQueue(pipeline_config, workers=4, stream_batch_size=2)
+    job_queue.enqueue_many(channel_ids)
+    run_until_idle(job_queue)
+    job_queue.close()
+
+    assert set(stored_jobs(pipeline_config["sqlite_path"]).values()) == {(SUCCEEDED, None)}
+    with sqlite3.connect(pipeline_config["sqlite_path"]) as sqlite_connection:
+        assert sqlite_connection.execute("SELECT COUNT(*) FROM videos").fetchone()[0] == 20
+        assert sqlite_connection.execute("SELECT COUNT(*) FROM comments").fetchone()[0] == 60
+
+
+def test_queue_leaves_jobs_of_other_batches_alone(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 2)
+    fake_youtube.add_channel("UC2", 2)
+    # Queued and abandoned jobs of a dashboard session with other credentials
+    add_job(pipeline_config["sqlite_path"], "UC1", batch="dashboard-other")
+    add_job(pipeline_config["sqlite_path"], "UC2", stage="videos", batch="dashboard-other", status=RUNNING,
+            heartbeat_at="2024-01-01 00:00:00")
+
+    job_queue = IngestionJobQueue(pipeline_config, workers=1, batch="dashboard-mine")
+    run_until_idle(job_queue)
+    job_queue.close()
+
+    assert stored_jobs(pipeline_config["sqlite_path"]) == {"UC1": (QUEUED, None), "UC2": (RUNNING, "videos")}
+    assert fake_youtube.calls == []
@@ -0,0 +1,63 @@
+import sqlite3
+
+from migrations import MIGRATIONS, apply_migrations, schema_version
+
+
+def test_fresh_database_is_migrated_once():
+    sqlite_connection = sqlite3.connect(":memory:")
+    assert apply_migrations(sqlite_connection) == [version for version, _, _ in MIGRATIONS]
+    assert schema_version(sqlite_connection) == MIGRATIONS[-1][0]
+    assert apply_migrations(sqlite_connection) == []
+
+
+def test_legacy_channel_statistics_become_integers():
+    # Tables as created before migrations existed, statistics stored as text
+    sqlite_connection = sqlite3.connect(":memory:")
+    sqlite_connection.execute(
+        "CREATE TABLE channels (channel_id TEXT PRIMARY KEY, channel_name TEXT, subscription_count INT, "
+        "channel_views TEXT, channel_description TEXT, playlist_id TEXT)")
+    sqlite_connection.executemany(
+        "INSERT INTO channels VALUES (?, ?, ?, ?, ?, ?)",
+        [("UC1", "One", "1200", "34000", "", "UU1"), ("UC2", "Two", "Not Available", "", "", "UU2")],
+    )
+    sqlite_connection.commit()
+
+    apply_migrations(sqlite_connection)
+    rows = sqlite_connection.execute(
+        "SELECT channel_id, subscription_count, channel_views FROM channels ORDER BY channel_id").fetchall()
+    assert rows == [("UC1", 1200, 34000), ("UC2", None, None)]
+
+
+def test_column_migrations_tolerate_existing_columns():
+    # A database whose user_version was rewound after the columns were added
+    sqlite_connection = sqlite3.connect(":memory:")
+    apply_migrations(sqlite_connection)
+    sqlite_connection.execute("PRAGMA user_version = 7")
+
+    assert apply_migrations(sqlite_connection) == [version for version, _, _ in MIGRATIONS if version > 7]
+    columns = {row[1] for row in sqlite_connection.execute("PRAGMA table_info(ingestion_jobs)")}
+    assert {"batch", "owner", "heartbeat_at", "sync_watermark"} <= columns
+
+
+def test_summaries_are_built_from_existing_data():
+    sqlite_connection = sqlite3.connect(":memory:")
+    sqlite_connection.execute("PRAGMA user_version = 3")
+    for step in MIGRATIONS[0][2]:
+        sqlite_connection.execute(step)
+    sqlite_connection.execute("INSERT INTO channels VALUES ('UC1', 'One', 1200, '34000', '', 'UU1')")
+    sqlite_connection.executemany(
+        "INSERT INTO videos (video_id, video_name, view_count, like_count, duration, playlist_id) "
+        "VALUES (?, ?, ?, ?, ?, 'UU1')",
+        [("v1", "First", 10, 1, 60), ("v2", "Second", 30, 3, 120)],
+    )
+    sqlite_connection.executemany(
+        "INSERT INTO comments (comment_Id, video_id) VALUES (?, ?)", [("c1", "v1"), ("c2", "v1"), ("c3", "v2")])
+    sqlite_connection.commit()
+
+    apply_migrations(sqlite_connection)
+    assert sqlite_connection.execute(
+        "SELECT channel_id, num_videos, total_views, total_likes, average_duration, num_comments "
+        "FROM channel_summary").fetchall() == [("UC1", 2, 40, 4, 90.0, 3)]
+    assert sqlite_connection.execute(
+        "SELECT video_id, channel_id, num_comments FROM video_summary ORDER BY video_id").fetchall() == [
+        ("v1", "UC1", 2), ("v2", "UC1", 1)]
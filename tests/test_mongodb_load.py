@@ -0,0 +1,66 @@
+import threading
+
+from youtube_data import MONGODB_LOAD, YouTubeDataPipeline
+
+
+class FakeCollection:
+    # In-memory stand-in for the per-entity collections, records whether the writer lock was free on each call
+
+    def __init__(self, writer_lock):
+        self.writer_lock = writer_lock
+        self.documents = {}
+        self.calls_under_lock = []
+
+    def check_lock(self, call):
+        # Another thread can only take the RLock if the calling thread does not hold it
+        free = []
+
+        def probe():
+            free.append(self.writer_lock.acquire(blocking=False))
+            if free[0]:
+                self.writer_lock.release()
+
+        probe_thread = threading.Thread(target=probe)
+        probe_thread.start()
+        probe_thread.join()
+        if not free[0]:
+            self.calls_under_lock.append(call)
+
+    def upsert(self, documents, key):
+        self.check_lock("upsert")
+        for document in documents:
+            self.documents[document[key]] = dict(document)
+
+    def matches(self, document, criteria):
+        for field, condition in criteria.items():
+            if isinstance(condition, dict):
+                if document.get(field) not in condition["$in"]:
+                    return False
+            elif document.get(field) != condition:
+                return False
+        return True
+
+    def find(self, criteria, projection=None):
+        self.check_lock("find")
+        return [dict(document) for document in self.documents.values() if self.matches(document, criteria)]
+
+    def find_one(self, criteria, projection=None):
+        found = self.find(criteria)
+        return found[0] if found else None
+
+
+def test_mongodb_load_keeps_mongodb_io_outside_the_writer_lock(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 3)
+    writer_lock = threading.RLock()
+    pipeline = YouTubeDataPipeline(**{**pipeline_config, "load_mode": MONGODB_LOAD}, sqlite_lock=writer_lock)
+    collections = [FakeCollection(writer_lock) for _ in range(3)]
+    pipeline.mongodb_channels, pipeline.mongodb_videos, pipeline.mongodb_comments = collections
+    pipeline.mongodb_bulk_upsert = lambda collection, documents, key: collection.upsert(documents, key)
+
+    pipeline.store_channel_data("UC1", pipeline.get_channel_info("UC1"))
+    pipeline.store_videos_data("UC1", pipeline.get_videos_info("UC1"))
+    pipeline.store_comments_data("UC1", pipeline.get_comments_info("UC1"))
+
+    assert [collection.calls_under_lock for collection in collections] == [[], [], []]
+    assert pipeline.sql_query("SELECT COUNT(*) AS comments FROM comments")["comments"][0] == 9
+    pipeline.close_connections()
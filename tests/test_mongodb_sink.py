@@ -0,0 +1,32 @@
+import pytest
+
+from mongodb_sink import MongoDBSink, MongoDBSinkError
+
+
+def test_failed_writes_are_raised_once_from_flush():
+    written = []
+
+    def write(collection, documents, key):
+        if collection == "broken":
+            raise ConnectionError("MongoDB unreachable")
+        written.append((collection, documents))
+
+    sink = MongoDBSink(write)
+    sink.submit("videos", [{"Video_ID": "v1"}], "Video_ID")
+    sink.submit("broken", [{"Video_ID": "v2"}], "Video_ID")
+
+    with pytest.raises(MongoDBSinkError, match="1 MongoDB batch writes failed"):
+        sink.flush()
+    sink.flush()
+    sink.close()
+    assert written == [("videos", [{"Video_ID": "v1"}])]
+
+
+def test_close_raises_failed_writes():
+    def write(collection, documents, key):
+        raise ConnectionError("MongoDB unreachable")
+
+    sink = MongoDBSink(write)
+    sink.submit("videos", [{"Video_ID": "v1"}], "Video_ID")
+    with pytest.raises(MongoDBSinkError):
+        sink.close()
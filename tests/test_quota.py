@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from quota import INTERACTIVE_PRIORITY, QuotaExceededError, QuotaReserveError, QuotaScheduler
+
+
+def test_new_channel_waits_while_budget_is_reserved():
+    scheduler = QuotaScheduler(daily_budget=10, requests_per_second=1000, start_reserve=0.2)
+    first = scheduler.start_channel("UC1")
+    for _ in range(9):
+        scheduler.acquire("commentThreads", first)
+
+    # 1 unit left is below the 2 unit reserve, only the started channel may spend it
+    with pytest.raises(QuotaReserveError):
+        scheduler.start_channel("UC2")
+    scheduler.acquire("commentThreads", first)
+
+    with pytest.raises(QuotaExceededError) as error:
+        scheduler.acquire("commentThreads", first)
+    assert not isinstance(error.value, QuotaReserveError)
+
+
+def test_resumed_channel_is_not_held_back_by_the_reserve():
+    scheduler = QuotaScheduler(daily_budget=10, requests_per_second=1000, used_units=9, start_reserve=0.2)
+    priority = scheduler.start_channel("UC1", resumed=True)
+    scheduler.acquire("videos", priority)
+    assert scheduler.remaining_units == 0
+
+    with pytest.raises(QuotaExceededError):
+        scheduler.start_channel("UC2", resumed=True)
+
+
+def test_comments_of_a_started_channel_are_not_starved():
+    # Before, comments needed 20% of the budget left and stopped long before videos did
+    scheduler = QuotaScheduler(daily_budget=100, requests_per_second=1000)
+    priority = scheduler.start_channel("UC1")
+    for _ in range(100):
+        scheduler.acquire("commentThreads", priority)
+    assert scheduler.remaining_units == 0
+
+
+def test_earlier_channel_is_served_first():
+    scheduler = QuotaScheduler(daily_budget=100, requests_per_second=5, burst=1)
+    first = scheduler.start_channel("UC1")
+    second = scheduler.start_channel("UC2")
+    assert INTERACTIVE_PRIORITY < first < second
+
+    # Spend the only token, both requests below have to wait for the next one
+    scheduler.acquire("videos", first)
+    served = []
+
+    def request(priority):
+        scheduler.acquire("commentThreads", priority)
+        served.append(priority)
+
+    later_channel = threading.Thread(target=request, args=(second,))
+    later_channel.start()
+    time.sleep(0.05)
+    earlier_channel = threading.Thread(target=request, args=(first,))
+    earlier_channel.start()
+    later_channel.join()
+    earlier_channel.join()
+
+    assert served == [first, second]
+
+
+def test_usage_is_shared_through_the_database(tmp_path):
+    sqlite_path = str(tmp_path / "youtube_data.sqlite")
+    first_run = QuotaScheduler(daily_budget=10, requests_per_second=1000, sqlite_path=sqlite_path)
+    for _ in range(6):
+        first_run.acquire("videos")
+
+    # A rerun on the same quota day starts from what the first run spent
+    rerun = QuotaScheduler(daily_budget=10, requests_per_second=1000, sqlite_path=sqlite_path)
+    assert rerun.remaining_units == 4
+    assert rerun.status()["usage_by_endpoint"] == {"videos": 6}
+
+    # Both see each other's requests from their next request on
+    rerun.acquire("commentThreads")
+    first_run.acquire("commentThreads")
+    assert first_run.remaining_units == 2
+
+
+def test_exhausted_quota_is_remembered_for_the_day(tmp_path):
+    sqlite_path = str(tmp_path / "youtube_data.sqlite")
+    scheduler = QuotaScheduler(daily_budget=10, requests_per_second=1000, sqlite_path=sqlite_path)
+    scheduler.acquire("videos")
+    scheduler.mark_exhausted()
+
+    rerun = QuotaScheduler(daily_budget=10, requests_per_second=1000, sqlite_path=sqlite_path)
+    with pytest.raises(QuotaExceededError):
+        rerun.start_channel("UC1")
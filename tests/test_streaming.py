@@ -0,0 +1,47 @@
+import sqlite3
+import threading
+
+from youtube_data import YouTubeDataPipeline
+
+
+def test_comments_of_a_large_video_are_committed_before_it_is_fetched(pipeline_config, fake_youtube):
+    fake_youtube.comments_per_video = 1000
+    fake_youtube.add_channel("UC1", 1)
+    pipeline = YouTubeDataPipeline(**pipeline_config, comment_workers=1)
+    pipeline.store_channel_data("UC1", pipeline.get_channel_info("UC1"))
+    pipeline.store_videos_data("UC1", pipeline.get_videos_info("UC1"))
+    committed = []
+
+    def count_committed(resource, params):
+        if resource == "commentThreads" and params.get("pageToken") == "600":
+            with sqlite3.connect(pipeline_config["sqlite_path"]) as sqlite_connection:
+                committed.append(sqlite_connection.execute("SELECT COUNT(*) FROM comments").fetchone()[0])
+
+    fake_youtube.fail = count_committed
+    pipeline.stream_comments_data("UC1", batch_size=100)
+
+    # Only a few pages wait in memory, the earlier ones are already in SQLite
+    assert committed[0] >= 200
+    assert pipeline.load_stats["comments"]["rows"] == 1000
+    pipeline.close_connections()
+
+
+def test_comment_threads_outlive_the_channel(pipeline_config, fake_youtube):
+    fake_youtube.add_channel("UC1", 4)
+    fake_youtube.add_channel("UC2", 4)
+    pipeline = YouTubeDataPipeline(**pipeline_config, comment_workers=2)
+    comment_threads = set()
+
+    def record_thread(resource, params):
+        if resource == "commentThreads":
+            comment_threads.add(threading.current_thread().name)
+
+    fake_youtube.fail = record_thread
+    for channel_id in ("UC1", "UC2"):
+        pipeline.store_channel_data(channel_id, pipeline.get_channel_info(channel_id))
+        pipeline.store_videos_data(channel_id, pipeline.get_videos_info(channel_id))
+        pipeline.stream_comments_data(channel_id)
+
+    # Both channels' comments are fetched by the same threads, and so over the same HTTP connections
+    assert len(comment_threads) <= 2
+    pipeline.close_connections()
@@ -1,35 +1,83 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
-from transformers import pipeline
-import time
-import matplotlib.pyplot as plt
-import os
+import threading
+
+from migrations import apply_migrations
+from sentiment import DEFAULT_BATCH_SIZE, get_sentiment_engine, load_sentiment_scores, save_sentiment_scores
+from summaries import bump_data_version, read_data_version
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_sql_query(_visualise, sqlite_path, query, data_version):
+    # sqlite_path, query and data_version form the cache key
+    return _visualise.read_sql_query(query)
+
 
 class YouTubeDataVisualisation:
     def __init__(self, sqlite_path):
         # Initialize connection
         self.sqlite_path = sqlite_path
-        self.sqlite_connection = sqlite3.connect(self.sqlite_path)
+        # Kept for the life of the process and shared by Streamlit sessions, reads go through _sqlite_lock
+        self.sqlite_connection = sqlite3.connect(self.sqlite_path, check_same_thread=False)
         self.sqlite_cursor = self.sqlite_connection.cursor()
+        self._sqlite_lock = threading.Lock()
+        apply_migrations(self.sqlite_connection)
+
+    def data_version(self):
+        with self._sqlite_lock:
+            return read_data_version(self.sqlite_connection)
+
+    def read_sql_query(self, query):
+        with self._sqlite_lock:
+            return pd.read_sql_query(query, self.sqlite_connection)
 
     def sql_query(self, query):
         try:
-            result = pd.read_sql_query(query, self.sqlite_connection)
+            # Results are reused until a pipeline run bumps the data version
+            result = cached_sql_query(self, self.sqlite_path, query, self.data_version())
             return result
         except Exception as e:
             st.error(f"Error executing SQL query: {e}")
             return None
 
-    def nlp_analysis(self, comments_result):
-        data = []
+    def nlp_analysis(self, comments_result, batch_size=DEFAULT_BATCH_SIZE):
+        engine = get_sentiment_engine()
+        comments = comments_result['comment_text'].tolist()
+        # Free-form queries may not select comment_Id, those rows are scored but not stored
+        if 'comment_Id' in comments_result.columns:
+            comment_ids = comments_result['comment_Id'].tolist()
+        else:
+            comment_ids = [None] * len(comments)
+
+        with self._sqlite_lock:
+            stored = load_sentiment_scores(
+                self.sqlite_connection, [cid for cid in comment_ids if cid is not None], engine.model_id)
+
+        missing = [index for index, cid in enumerate(comment_ids) if cid not in stored]
+        scored = engine.classify([comments[index] for index in missing], batch_size=batch_size)
 
-        classifier = pipeline("sentiment-analysis")
-        for comment in comments_result['comment_text']:
-            sentiment = classifier(comment)
-            data.append({"comment": comment, "sentiment": sentiment[0]['label'], "score": sentiment[0]['score']})
+        new_scores = {comment_ids[index]: sentiment for index, sentiment in zip(missing, scored)
+                      if comment_ids[index] is not None}
+        if new_scores:
+            with self._sqlite_lock, self.sqlite_connection:
+                save_sentiment_scores(self.sqlite_connection, new_scores, engine.model_id)
+                bump_data_version(self.sqlite_connection)
+
+        sentiments = [stored.get(cid) for cid in comment_ids]
+        for index, sentiment in zip(missing, scored):
+            sentiments[index] = sentiment
+
+        data = [
+            {"comment": comment, "sentiment": sentiment['label'], "score": sentiment['score']}
+            for comment, sentiment in zip(comments, sentiments)
+        ]
 
         st.subheader("Sentiment Analysis")
+        stats = engine.last_stats
+        st.caption(f"{len(comments) - len(missing)} comments reused stored scores, "
+                   f"{stats['unique_texts']} distinct texts scored in {stats['seconds']:.1f}s "
+                   f"({stats['texts_per_second']:,.0f} texts/s, batch size {batch_size}).")
         sentiment_container = st.container(border=True)
         with sentiment_container:
             for entry in data:
@@ -135,10 +183,9 @@ class YouTubeDataVisualisation:
                 """,
 
             "Which channels have the most number of videos, and how many videos do they have?":
-                """SELECT c.channel_name, COUNT(*) AS num_videos
-                FROM channels c
-                INNER JOIN videos v ON v.playlist_id = c.playlist_id
-                GROUP BY c.channel_name
+                """SELECT channel_name, num_videos
+                FROM channel_summary
+                WHERE num_videos > 0
                 ORDER BY num_videos DESC;
                 """,
 
@@ -150,9 +197,9 @@ class YouTubeDataVisualisation:
                 LIMIT 10;""",
 
             "How many comments were made on each video, and what are their corresponding video names?":
-                """SELECT v.video_name, COUNT(*) AS num_comments
-                FROM videos v INNER JOIN comments c ON v.video_id = c.video_id
-                GROUP BY v.video_name;""",
+                """SELECT video_name, num_comments
+                FROM video_summary
+                WHERE num_comments > 0;""",
 
             "Which videos have the highest number of likes, and what are their corresponding channel names?" :
                 """SELECT v.video_name, c.channel_name, v.like_count
@@ -161,9 +208,9 @@ class YouTubeDataVisualisation:
                 LIMIT 10;""",
 
             "What is the total number of views for each channel, and what are their corresponding channel names?" :
-                """SELECT c.channel_name, SUM(v.view_count) AS total_views
-                FROM channels c INNER JOIN videos v ON v.playlist_id = c.playlist_id
-                GROUP BY c.channel_name;""",
+                """SELECT channel_name, total_views
+                FROM channel_summary
+                WHERE num_videos > 0;""",
 
             "What are the names of all the channels that have published videos in the year 2022?" :
                 """
@@ -173,14 +220,15 @@ class YouTubeDataVisualisation:
                     """,
 
             "What is the average duration of all videos in each channel, and what are their corresponding channel names?":
-                """SELECT c.channel_name, AVG(v.duration) AS average_duration
-                FROM channels c INNER JOIN videos v ON v.playlist_id = c.playlist_id
-                GROUP BY c.channel_name;""",
+                """SELECT channel_name, average_duration
+                FROM channel_summary
+                WHERE num_videos > 0;""",
 
             "Which videos have the highest number of comments, and what are their corresponding channel names?" :
-                """SELECT v.video_name, c2.channel_name, COUNT(*) AS num_comments
-                FROM videos v INNER JOIN comments c ON v.video_id = c.video_id INNER JOIN channels c2 ON v.playlist_id = c2.playlist_id
-                GROUP BY v.video_name, c2.channel_name;""",
+                """SELECT video_name, channel_name, num_comments
+                FROM video_summary
+                WHERE num_comments > 0
+                ORDER BY num_comments DESC;""",
 
         }
         # User interface for selecting and displaying SQL queries
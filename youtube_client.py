@@ -0,0 +1,34 @@
+import threading
+
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+
+# One discovery client per API key for the whole process
+_services = {}
+_services_lock = threading.Lock()
+
+# Per-thread HTTP objects, httplib2 is not thread-safe
+_thread_local = threading.local()
+
+
+def get_youtube_service(api_key):
+    # Built from the discovery document bundled with google-api-python-client, so no discovery
+    # request is made. The service only builds request objects and is safe to share between threads
+    # as long as every thread executes them with its own HTTP object, see thread_http.
+    with _services_lock:
+        service = _services.get(api_key)
+        if service is None:
+            service = build('youtube', 'v3', developerKey=api_key, static_discovery=True, cache_discovery=False)
+            _services[api_key] = service
+        return service
+
+
+def thread_http():
+    # httplib2 keeps connections alive per Http object, so each worker thread reuses its
+    # TLS connections to the API across requests and pipelines
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = build_http()
+        _thread_local.http = http
+    return http
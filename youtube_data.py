@@ -1,239 +1,680 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
 import pymongo
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+import concurrent.futures
+import functools
+import queue
+import threading
 import isodate
 import datetime
 import time
-import matplotlib.pyplot as plt
-import os
+
+from migrations import apply_migrations, to_int_or_null
+from mongodb_sink import MongoDBSink
+from quota import INTERACTIVE_PRIORITY, QuotaExceededError, http_error_reason
+from resilience import (
+    CircuitBreaker, CircuitOpenError, RequestMetrics, RetriesExhaustedError, RetryPolicy,
+    is_not_modified, is_retryable,
+)
+from response_cache import ResponseCache, endpoint_name
+from summaries import bump_data_version, refresh_summaries
+from youtube_client import get_youtube_service, thread_http
+
+
+# Records per committed batch in the streaming load
+STREAM_BATCH_SIZE = 1000
+
+# videos.list accepts at most 50 comma-separated IDs per request
+VIDEOS_PER_REQUEST = 50
+
+# channels.list has the same limit
+CHANNELS_PER_REQUEST = 50
+
+# Pipeline load modes
+MONGODB_LOAD = "mongodb"
+DIRECT_LOAD = "direct"
+
+# Operations per MongoDB bulk_write call
+MONGODB_BULK_WRITE_SIZE = 1000
+
+# Error reasons returned by the API once the daily quota is used up
+QUOTA_ERROR_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+
+# commentThreads.list returns at most 100 threads per page
+COMMENTS_PER_PAGE = 100
+
+# Loader columns per table, the first column is the primary key
+CHANNEL_COLUMNS = (
+    "channel_id", "channel_name", "subscription_count", "channel_views",
+    "channel_description", "playlist_id",
+)
+
+VIDEO_COLUMNS = (
+    "video_id", "video_name", "video_description", "tags",
+    "published_at", "view_count", "like_count", "favorite_count",
+    "comment_count", "duration", "caption", "thumbnail", "playlist_id",
+)
+
+COMMENT_COLUMNS = (
+    "comment_Id", "video_id", "comment_text",
+    "comment_author", "comment_published_date",
+)
+
+
+def upsert_query(table_name, columns):
+    # Insert new rows and rewrite existing ones only when a column actually changed
+    key_column, *value_columns = columns
+    assignments = ", ".join(f"{column} = excluded.{column}" for column in value_columns)
+    changed = " OR ".join(f"{table_name}.{column} IS NOT excluded.{column}" for column in value_columns)
+    return f"""
+        INSERT INTO {table_name} ({", ".join(columns)})
+        VALUES ({", ".join("?" for _ in columns)})
+        ON CONFLICT({key_column}) DO UPDATE SET {assignments}
+        WHERE {changed}
+    """
+
+
+CHANNEL_UPSERT_QUERY = upsert_query("channels", CHANNEL_COLUMNS)
+COMMENT_UPSERT_QUERY = upsert_query("comments", COMMENT_COLUMNS)
+
+# Connection settings for bulk loading. WAL also lets the dashboard read while the pipeline writes.
+LOADER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=30000",
+)
+
+
+def configure_sqlite_connection(sqlite_connection):
+    for pragma in LOADER_PRAGMAS:
+        sqlite_connection.execute(pragma)
+    return sqlite_connection
+
+
+def chunked(iterable, size):
+    # Yield successive lists of at most `size` items
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parallel_chain(generator_function, iterable, executor, max_workers):
+    # Run generator_function(item) for up to max_workers items at a time on the executor and yield
+    # the values of all the generators as they arrive. At most 2 * max_workers values wait to be
+    # consumed, a generator blocks until the consumer catches up.
+    results = queue.Queue(maxsize=2 * max_workers)
+    stopping = threading.Event()
+    value_result, error_result, done_result = "value", "error", "done"
+
+    def produce(item):
+        try:
+            for value in generator_function(item):
+                results.put((value_result, value))
+                if stopping.is_set():
+                    return
+        except Exception as e:
+            results.put((error_result, e))
+        finally:
+            results.put((done_result, None))
+
+    items = iter(iterable)
+    running = 0
+    try:
+        for item in items:
+            executor.submit(produce, item)
+            running += 1
+            if running == max_workers:
+                break
+
+        while running:
+            kind, value = results.get()
+            if kind == value_result:
+                yield value
+            elif kind == error_result:
+                raise value
+            else:
+                running -= 1
+                for item in items:
+                    executor.submit(produce, item)
+                    running += 1
+                    break
+    finally:
+        # Consumer stopped or failed: let the producers finish their current value and exit
+        stopping.set()
+        while running:
+            if results.get()[0] == done_result:
+                running -= 1
+
+
+def build_channel_information(channel_item, channel_id):
+    # Extract channel details from a channels.list item
+    return {
+        "Channel_Name": channel_item["snippet"]["title"],
+        "Channel_ID": channel_id,
+        # Hidden or missing statistics are stored as NULL
+        "Subscription_Count": to_int_or_null(channel_item["statistics"].get("subscriberCount")),
+        "Channel_Views": to_int_or_null(channel_item["statistics"].get("viewCount")),
+        "Channel_Description": channel_item["snippet"].get("description", "Not Available"),
+        "Playlist_ID": channel_item["contentDetails"]["relatedPlaylists"]["uploads"],
+    }
+
+
+def build_video_information(video_item, channel_id, playlist_id):
+    # Extract video details from a videos.list item and handle missing fields
+    snippet = video_item["snippet"]
+    statistics = video_item.get("statistics", {})
+    content_details = video_item["contentDetails"]
+
+    return {
+        "Channel_ID": channel_id,
+        "Video_ID": video_item["id"],
+        "Video_Name": snippet["title"],
+        "Video_Description": snippet.get("description", "Not Available"),
+        "Tags": snippet.get("tags", "Not Available"),
+        "Published_At": datetime.datetime.strptime(
+            snippet["publishedAt"], "%Y-%m-%dT%H:%M:%SZ"
+        ).strftime("%Y-%m-%d %H:%M:%S"),
+        "View_Count": int(statistics.get("viewCount", 0)),
+        "Like_Count": int(statistics.get("likeCount", 0)),
+        "Dislike_Count": int(statistics.get("dislikeCount", 0)),
+        "Favorite_Count": int(statistics.get("favoriteCount", 0)),
+        "Comment_Count": int(statistics.get("commentCount", 0)),
+        "Duration": isodate.parse_duration(content_details["duration"]).total_seconds(),
+        "Caption": bool(content_details.get("caption", False)),
+        "Thumbnail": snippet["thumbnails"]["default"]["url"],
+        "Playlist_ID": playlist_id,
+    }
+
+
+def build_comment_information(comment_item, video_id):
+    # Extract top-level comment details from a commentThreads.list item
+    comment_details = comment_item["snippet"]["topLevelComment"]
+
+    return {
+        "Video_ID": video_id,
+        "Comment_ID": comment_details["id"],
+        "Comment_Text": comment_details["snippet"]["textDisplay"],
+        "Comment_Author": comment_details["snippet"]["authorDisplayName"],
+        "Comment_Published_At": datetime.datetime.strptime(
+            comment_details["snippet"]["publishedAt"], "%Y-%m-%dT%H:%M:%SZ"
+        ).strftime("%Y-%m-%d %H:%M:%S"),
+    }
 
 
 class YouTubeDataPipeline:
-    def __init__(self, api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection):
+    def __init__(self, api_key, sqlite_path, mongodb_connection_string, mongodb_database, mongodb_collection,
+                 max_comments_per_video=None, comment_workers=8, response_cache_path=None,
+                 quota_scheduler=None, retry_policy=None, circuit_breaker=None, request_metrics=None,
+                 incremental=False, load_mode=MONGODB_LOAD, mongodb_sink=True, progress_callback=None,
+                 sqlite_connection=None, sqlite_lock=None):
         # Initialize connections
         self.api_key = api_key
         self.sqlite_path = sqlite_path
         self.mongodb_connection_string = mongodb_connection_string
         self.mongodb_database = mongodb_database
         self.mongodb_collection_name = mongodb_collection
-        self.youtube = build('youtube', 'v3', developerKey=self.api_key)
-        self.sqlite_connection = sqlite3.connect(self.sqlite_path)
+        # Shared by every pipeline using this API key, see youtube_client
+        self.youtube = get_youtube_service(self.api_key)
+        # The connection may be shared across Streamlit script threads, writes go through _sqlite_lock.
+        # Pipelines given the same sqlite_connection and sqlite_lock (an RLock) write through one serialized
+        # connection, the job queue does this for its workers so they never wait on each other's write locks.
+        self._owns_sqlite_connection = sqlite_connection is None
+        if sqlite_connection is None:
+            sqlite_connection = configure_sqlite_connection(
+                sqlite3.connect(self.sqlite_path, check_same_thread=False))
+        self.sqlite_connection = sqlite_connection
+        self._sqlite_lock = sqlite_lock or threading.RLock()
         self.sqlite_cursor = self.sqlite_connection.cursor()
+        with self._sqlite_lock:
+            apply_migrations(self.sqlite_connection)
         self.mongodb_client = pymongo.MongoClient(self.mongodb_connection_string)
         self.mongodb_db = self.mongodb_client[self.mongodb_database]
         self.mongodb_collection = self.mongodb_db[self.mongodb_collection_name]
 
+        # Data lake collections per entity, named after the configured collection
+        self.mongodb_channels = self.mongodb_db[f"{self.mongodb_collection_name}_channels"]
+        self.mongodb_videos = self.mongodb_db[f"{self.mongodb_collection_name}_videos"]
+        self.mongodb_comments = self.mongodb_db[f"{self.mongodb_collection_name}_comments"]
+        self._mongodb_indexes_ready = False
+
+        # MONGODB_LOAD reads every stage back from MongoDB before loading SQLite,
+        # DIRECT_LOAD loads SQLite from the fetched records and optionally sinks them to MongoDB in parallel
+        self.load_mode = load_mode
+        self.mongodb_sink = MongoDBSink(self.mongodb_bulk_upsert) if load_mode == DIRECT_LOAD and mongodb_sink else None
+
+        # Comment harvesting limits (None means every comment of every video)
+        self.max_comments_per_video = max_comments_per_video
+        self.comment_workers = comment_workers
+        # Comment fetch threads live as long as the pipeline, so their per-thread HTTP objects
+        # (see thread_http) keep their API connections open from one channel to the next
+        self.comment_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=comment_workers, thread_name_prefix="youtube-comments")
+
+        # Rows loaded and throughput of the last bulk load per stage
+        self.load_stats = {}
+
+        # Optional progress_callback(stage, pages, rows), called from fetch threads as pages
+        # arrive and after each stage's rows are committed
+        self.progress_callback = progress_callback
+
+        # Incremental mode only fetches uploads published after the channel's sync watermark, see get_sync_watermark
+        self.incremental = incremental
+
+        # Optional persistent HTTP response cache shared across runs
+        self.response_cache = ResponseCache(response_cache_path) if response_cache_path else None
+
+        # Optional QuotaScheduler, share one instance between pipelines using the same API key.
+        # Ingestion jobs set quota_priority from QuotaScheduler.start_channel for each channel.
+        self.quota_scheduler = quota_scheduler
+        self.quota_priority = INTERACTIVE_PRIORITY
+
+        # Retry, circuit breaking and request metrics, pass shared instances to aggregate across pipelines
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.request_metrics = request_metrics or RequestMetrics()
+
+        # Request cache for the current run, see clear_request_cache
+        self._request_cache = {}
+        self._request_cache_lock = threading.Lock()
+
+    def execute_with_retries(self, api_function, **kwargs):
+        endpoint = endpoint_name(api_function.uri)
+        attempt = 1
+
+        while True:
+            # Pace the request and charge its quota cost, raises QuotaExceededError when the budget is spent
+            if self.quota_scheduler is not None:
+                self.quota_scheduler.acquire(endpoint, self.quota_priority)
+            self.circuit_breaker.before_request()
+
+            started = time.perf_counter()
+            try:
+                response = api_function.execute(**kwargs)
+            except Exception as e:
+                self.request_metrics.record(endpoint, time.perf_counter() - started, failed=not is_not_modified(e))
+                if not is_retryable(e):
+                    # The API answered, a client error says nothing about its health
+                    self.circuit_breaker.record_success()
+                    raise
+
+                self.circuit_breaker.record_failure()
+                if attempt >= self.retry_policy.max_attempts:
+                    raise RetriesExhaustedError(f"{endpoint} request failed after {attempt} attempts: {e}") from e
+
+                self.request_metrics.record_retry(endpoint)
+                time.sleep(self.retry_policy.delay(attempt))
+                attempt += 1
+            else:
+                self.request_metrics.record(endpoint, time.perf_counter() - started)
+                self.circuit_breaker.record_success()
+                return response
+
+    def report_progress(self, stage, pages=0, rows=0):
+        if self.progress_callback is not None:
+            self.progress_callback(stage, pages, rows)
+
+    # Per-run memo shared by the channel, video and comment stages
+    def memoized(self, key, compute):
+        with self._request_cache_lock:
+            if key in self._request_cache:
+                return self._request_cache[key]
+
+        value = compute()
+        if value is not None:
+            with self._request_cache_lock:
+                value = self._request_cache.setdefault(key, value)
+        return value
+
+    def clear_request_cache(self):
+        with self._request_cache_lock:
+            self._request_cache.clear()
+
     # Generic function to make YouTube API requests
     def make_youtube_api_request(self, api_function, **kwargs):
+        # Serve fresh responses from the on-disk cache, revalidate stale ones by ETag
+        cached = None
+        if self.response_cache is not None:
+            cached = self.response_cache.get(api_function.uri)
+            if cached is not None and cached.fresh:
+                return cached.response
+            if cached is not None and cached.etag:
+                api_function.headers["If-None-Match"] = cached.etag
+
         try:
-            response = api_function.execute(**kwargs)
-            return response
+            kwargs.setdefault("http", thread_http())
+            response = self.execute_with_retries(api_function, **kwargs)
+        except HttpError as e:
+            if is_not_modified(e) and cached is not None:
+                self.response_cache.touch(api_function.uri)
+                return cached.response
+            if http_error_reason(e) in QUOTA_ERROR_REASONS:
+                # Stop the stage instead of returning a partial result
+                if self.quota_scheduler is not None:
+                    self.quota_scheduler.mark_exhausted()
+                raise QuotaExceededError(f"YouTube API quota exhausted: {e}") from e
+            print(f"Error making YouTube API request: {e}")
+            return None
+        except (QuotaExceededError, RetriesExhaustedError, CircuitOpenError):
+            raise
         except Exception as e:
             print(f"Error making YouTube API request: {e}")
             return None
 
+        if self.response_cache is not None and response:
+            self.response_cache.put(api_function.uri, response)
+        return response
+
+    def get_channel_resource(self, channel_id):
+        # None when the channel does not exist or its lookup failed
+        return self.get_channel_resources([channel_id]).get(channel_id)
+
+    def get_channel_resources(self, channel_ids):
+        # Resolve channels in batches of up to 50 IDs per channels.list call.
+        # Returns {channel_id: item or None}, None for IDs that do not resolve to a channel.
+        # IDs of a batch whose request failed are left out, so they are not mistaken for unknown channels.
+        # Each item is memoized for the rest of the run.
+        channel_ids = list(dict.fromkeys(channel_ids))
+        channel_resources = {}
+
+        with self._request_cache_lock:
+            for channel_id in channel_ids:
+                channel_resources[channel_id] = self._request_cache.get(("channel_resource", channel_id))
+        missing_ids = [channel_id for channel_id in channel_ids if channel_resources[channel_id] is None]
+
+        for channel_id_batch in chunked(missing_ids, CHANNELS_PER_REQUEST):
+            api_function = self.youtube.channels().list(
+                part="snippet,statistics,contentDetails",
+                id=",".join(channel_id_batch),
+            )
+            response = self.make_youtube_api_request(api_function)
+            if response is None:
+                for channel_id in channel_id_batch:
+                    del channel_resources[channel_id]
+                continue
+
+            # IDs that do not resolve to a channel are missing from the items and stay None
+            for item in response.get("items", []):
+                if item["id"] in channel_resources:
+                    channel_resources[item["id"]] = self.memoized(("channel_resource", item["id"]), lambda: item)
+
+        return channel_resources
+
     def get_channel_info(self, channel_id):
-        api_function = self.youtube.channels().list(
-            part="snippet,statistics,contentDetails", id=channel_id)
-        channel_response = self.make_youtube_api_request(api_function)
-
-        if channel_response:
-            channel_information = {
-                "Channel_Name": channel_response["items"][0]["snippet"]["title"],
-                "Channel_ID": channel_id,
-                "Subscription_Count": channel_response["items"][0]["statistics"].get("subscriberCount", "Not Available"),
-                "Channel_Views": channel_response["items"][0]["statistics"].get("viewCount", "Not Available"),
-                "Channel_Description": channel_response["items"][0]["snippet"].get("description", "Not Available"),
-                "Playlist_ID": channel_response["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"],
-            }
-            return channel_information
-        else:
-            return None
+        return self.get_channels_info([channel_id]).get(channel_id)
+
+    def get_channels_info(self, channel_ids):
+        # {channel_id: channel information, or None when the channel could not be found},
+        # channels whose lookup failed are left out, see get_channel_resources
+        return {
+            channel_id: build_channel_information(channel_resource, channel_id) if channel_resource else None
+            for channel_id, channel_resource in self.get_channel_resources(channel_ids).items()
+        }
 
     def get_video_ids(self, channel_id):
-        api_function = self.youtube.channels().list(part="contentDetails", id=channel_id)
-        channel_response = self.make_youtube_api_request(api_function)
-
-        if channel_response:
-            playlist_id = channel_response["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
+        # The uploads playlist is walked once per run and shared by every stage
+        return self.memoized(("video_ids", channel_id), lambda: self.fetch_video_ids(channel_id))
+
+    def get_new_video_ids(self, channel_id):
+        # Uploads published after the channel's sync watermark, computed once per run so every stage sees the same set
+        return self.memoized(
+            ("new_video_ids", channel_id),
+            lambda: self.fetch_video_ids(channel_id, since=self.get_sync_watermark(channel_id)),
+        )
 
+    def get_stage_video_ids(self, channel_id):
+        # Videos the video and comment stages work on in the current mode
+        if self.incremental:
+            return self.get_new_video_ids(channel_id)
+        return self.get_video_ids(channel_id)
+
+    def get_sync_watermark(self, channel_id):
+        # Newest published_at of the channel as of its last completed videos stage, None before the first one.
+        # The stored watermark only moves once a videos stage is fully committed, so an interrupted stage
+        # fetches every upload since the previous watermark again. Read once per run.
+        key = ("sync_watermark", channel_id)
+        with self._request_cache_lock:
+            if key in self._request_cache:
+                return self._request_cache[key]
+
+        with self._sqlite_lock:
+            row = self.sqlite_connection.execute(
+                "SELECT newest_published_at FROM channel_sync_state WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        return self.set_sync_watermark(channel_id, row[0] if row else None)
+
+    def set_sync_watermark(self, channel_id, newest_published_at):
+        # Overrides the watermark for the rest of the run, e.g. with the one a resumed job started from
+        with self._request_cache_lock:
+            self._request_cache[("sync_watermark", channel_id)] = newest_published_at
+        return newest_published_at
+
+    def fetch_video_ids(self, channel_id, since=None):
+        # With since ("YYYY-MM-DD HH:MM:SS"), only uploads published after it. The uploads playlist
+        # is ordered newest first, so paging stops at the first page reaching back to since.
+        channel_resource = self.get_channel_resource(channel_id)
+        if channel_resource is None:
+            return []
+        playlist_id = channel_resource["contentDetails"]["relatedPlaylists"]["uploads"]
+
+        video_ids = []
+        page_token = None
+        while True:
             api_function = self.youtube.playlistItems().list(
-                part="contentDetails", playlistId=playlist_id, maxResults=50)
+                part="contentDetails", playlistId=playlist_id, maxResults=50, pageToken=page_token)
             response = self.make_youtube_api_request(api_function)
-
-            if response:
-                video_ids = [item["contentDetails"]["videoId"] for item in response.get("items", [])]
-                next_page_token = response.get("nextPageToken")
-                more_pages = True
-
-                while next_page_token and more_pages:
-                    api_function = self.youtube.playlistItems().list(
-                        part="contentDetails",
-                        playlistId=playlist_id,
-                        maxResults=50,
-                        pageToken=next_page_token,
-                    )
-                    response = self.make_youtube_api_request(api_function)
-
-                    if response:
-                        video_ids.extend(
-                            [data["contentDetails"]["videoId"] for data in response.get("items", [])]
-                        )
-                        next_page_token = response.get("nextPageToken")
-                    else:
-                        more_pages = False
-
+            if not response:
+                return video_ids
+            self.report_progress("videos", pages=1)
+
+            reached_since = False
+            for item in response.get("items", []):
+                published_at = item["contentDetails"].get("videoPublishedAt")
+                if since is not None and published_at is not None:
+                    published_at = datetime.datetime.strptime(
+                        published_at, "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S")
+                    if published_at <= since:
+                        reached_since = True
+                        continue
+                # Private and deleted uploads have no publish date and are kept, videos.list skips them
+                video_ids.append(item["contentDetails"]["videoId"])
+
+            page_token = response.get("nextPageToken")
+            if not page_token or reached_since:
                 return video_ids
-        return []
-
-    def get_videos_info(self, channel_id):
-        channel_response = self.youtube.channels().list(part="snippet,statistics,contentDetails", id=channel_id).execute()
-        playlist_id = channel_response["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
 
-        all_video_info = []
+    def get_videos_details(self, video_ids):
+        # Fetch video resources in batches of up to 50 IDs per videos.list call
+        video_details = {}
 
-        for video_id in self.get_video_ids(channel_id):
+        for video_id_batch in chunked(video_ids, VIDEOS_PER_REQUEST):
+            # maxResults is not supported together with id, the response holds one item per found ID
             api_function = self.youtube.videos().list(
                 part="snippet,statistics,contentDetails",
-                id=video_id,
+                id=",".join(video_id_batch),
             )
-            video_details = self.make_youtube_api_request(api_function)
+            response = self.make_youtube_api_request(api_function)
+            returned_items = {}
+            if response:
+                self.report_progress("videos", pages=1)
+                returned_items = {item["id"]: item for item in response.get("items", [])}
+
+            # Deleted or private videos are simply left out of the response
+            for video_id in video_id_batch:
+                video_details[video_id] = returned_items.get(video_id)
+
+        return video_details
+
+    def iter_videos_info(self, channel_id):
+        # Stream video records one videos.list batch at a time
+        channel_resource = self.get_channel_resource(channel_id)
+        if channel_resource is None:
+            return
+        playlist_id = channel_resource["contentDetails"]["relatedPlaylists"]["uploads"]
+
+        for video_id_batch in chunked(self.get_stage_video_ids(channel_id), VIDEOS_PER_REQUEST):
+            for video_id, video_item in self.get_videos_details(video_id_batch).items():
+                if video_item is None:
+                    print(f"Video {video_id} not returned by the API (deleted, private or failed request), skipping")
+                    continue
 
-            if video_details:
                 try:
-                    # Extract video details and handle missing fields
-                    video_information = {
-                        "Channel_ID": channel_id,
-                        "Video_ID": video_id,
-                        "Video_Name": video_details["items"][0]["snippet"]["title"],
-                        "Video_Description": video_details["items"][0]["snippet"].get("description", "Not Available"),
-                        "Tags": video_details["items"][0]["snippet"].get("tags", "Not Available"),
-                        "Published_At": datetime.datetime.strptime(
-                            video_details["items"][0]["snippet"]["publishedAt"], "%Y-%m-%dT%H:%M:%SZ"
-                        ).strftime("%Y-%m-%d %H:%M:%S"),
-                        "View_Count": int(video_details["items"][0]["statistics"].get("viewCount", 0)),
-                        "Like_Count": int(video_details["items"][0]["statistics"].get("likeCount", 0)),
-                        "Dislike_Count": int(video_details["items"][0]["statistics"].get("dislikeCount", 0)),
-                        "Favorite_Count": int(video_details["items"][0]["statistics"].get("favoriteCount", 0)),
-                        "Comment_Count": int(video_details["items"][0]["statistics"].get("commentCount", 0)),
-                        "Duration": isodate.parse_duration(video_details["items"][0]["contentDetails"]["duration"]).total_seconds(),
-                        "Caption": bool(video_details["items"][0]["contentDetails"].get("caption", False)),
-                        "Thumbnail": video_details["items"][0]["snippet"]["thumbnails"]["default"]["url"],
-                        "Playlist_ID": playlist_id,
-                    }
-                    all_video_info.append(video_information)
+                    yield build_video_information(video_item, channel_id, playlist_id)
                 except KeyError as e:
                     print(f"Error processing video {video_id}: {e}")
                     continue
 
-        return all_video_info
+    def get_videos_info(self, channel_id):
+        return list(self.iter_videos_info(channel_id))
+
+    def iter_video_comment_pages(self, video_id, max_comments=None):
+        # Follow nextPageToken until the comments run out or the per-video cap is reached,
+        # yielding the comments of each page as it arrives
+        count = 0
+        page_token = None
 
-    def get_comments_info(self, channel_id):
-        comment_info = []
+        while max_comments is None or count < max_comments:
+            page_size = COMMENTS_PER_PAGE
+            if max_comments is not None:
+                page_size = min(page_size, max_comments - count)
 
-        for video_id in self.get_video_ids(channel_id):
             api_function = self.youtube.commentThreads().list(
-                part="snippet", videoId=video_id, maxResults=50
+                part="snippet", videoId=video_id, maxResults=page_size, pageToken=page_token
             )
             comment_response = self.make_youtube_api_request(api_function)
 
-            if comment_response:
-                for item in comment_response.get("items", []):
-                    comment_id = item["snippet"]["topLevelComment"]["id"]
-                    comment_details = item["snippet"]["topLevelComment"]
+            # Comments disabled or request failed
+            if not comment_response:
+                return
+            self.report_progress("comments", pages=1)
 
-                    comments_information = {
-                        "Video_ID": video_id,
-                        "Comment_ID": comment_id,
-                        "Comment_Text": comment_details["snippet"]["textDisplay"],
-                        "Comment_Author": comment_details["snippet"]["authorDisplayName"],
-                        "Comment_Published_At": datetime.datetime.strptime(
-                            comment_details["snippet"]["publishedAt"], "%Y-%m-%dT%H:%M:%SZ"
-                        ).strftime("%Y-%m-%d %H:%M:%S"),
-                    }
-                    comment_info.append(comments_information)
+            page = [build_comment_information(item, video_id) for item in comment_response.get("items", [])[:page_size]]
+            count += len(page)
+            yield page
 
-        return comment_info
+            page_token = comment_response.get("nextPageToken")
+            if not page_token:
+                return
 
+    def get_video_comments(self, video_id, max_comments=None):
+        return [comment for page in self.iter_video_comment_pages(video_id, max_comments) for comment in page]
 
-    def mongodb_channel_data(self, channel_id):
+    def iter_comments_info(self, channel_id):
+        # Stream comments page by page, fetching several videos in parallel. Pages are yielded as they
+        # arrive, so a video with a very large comment section is committed batch by batch too.
+        fetch_comment_pages = functools.partial(
+            self.iter_video_comment_pages, max_comments=self.max_comments_per_video)
 
-        # Define the criteria for filtering the documents
-        criteria = {
-            "Channel_ID": f"{channel_id}",
-            "Playlist_ID": {"$ne": None},
-            "Channel_Name": {"$ne": None},
-        }
+        video_ids = self.get_stage_video_ids(channel_id)
+        for page in parallel_chain(fetch_comment_pages, video_ids, self.comment_executor, self.comment_workers):
+            yield from page
+
+    def get_comments_info(self, channel_id):
+        return list(self.iter_comments_info(channel_id))
+
+    def ensure_mongodb_indexes(self):
+        # Unique entity keys make the bulk upserts idempotent, the rest serve the read-back queries
+        if self._mongodb_indexes_ready:
+            return
+        self.mongodb_channels.create_index("Channel_ID", unique=True)
+        self.mongodb_channels.create_index("Playlist_ID")
+        self.mongodb_videos.create_index("Video_ID", unique=True)
+        self.mongodb_videos.create_index("Playlist_ID")
+        self.mongodb_videos.create_index("Channel_ID")
+        self.mongodb_comments.create_index("Comment_ID", unique=True)
+        self.mongodb_comments.create_index("Video_ID")
+        self._mongodb_indexes_ready = True
+
+    def mongodb_bulk_upsert(self, collection, documents, key):
+        # One unordered bulk_write per batch, a failing document does not stop the others
+        self.ensure_mongodb_indexes()
+        operations = [
+            pymongo.UpdateOne({key: document[key]}, {"$set": document}, upsert=True)
+            for document in documents
+        ]
+        for operation_batch in chunked(operations, MONGODB_BULK_WRITE_SIZE):
+            collection.bulk_write(operation_batch, ordered=False)
+
+    def split_legacy_mongodb_collection(self):
+        # One-off copy of documents from the single shared collection into the per-entity collections,
+        # run with ingest_cli.py --split-legacy-mongodb-collection. Returns {collection name: documents copied}.
+        legacy_filters = (
+            (self.mongodb_channels, "Channel_ID", {"Playlist_ID": {"$ne": None}, "Channel_Name": {"$ne": None}}),
+            (self.mongodb_videos, "Video_ID", {"Video_ID": {"$ne": None}, "Video_Name": {"$ne": None}}),
+            (self.mongodb_comments, "Comment_ID", {"Comment_ID": {"$ne": None}}),
+        )
+        copied = {}
+        for collection, key, criteria in legacy_filters:
+            copied[collection.name] = 0
+            documents = self.mongodb_collection.find(criteria, {"_id": 0})
+            for document_batch in chunked(documents, MONGODB_BULK_WRITE_SIZE):
+                self.mongodb_bulk_upsert(collection, document_batch, key)
+                copied[collection.name] += len(document_batch)
+        return copied
+
+    def mongodb_channel_data(self, channel_id):
+        channel_data = None
 
         try:
             # Retrieve channel data from MongoDB
-            channel_data = self.mongodb_collection.find_one(criteria, {"_id": 0})
+            channel_data = self.mongodb_channels.find_one({"Channel_ID": channel_id}, {"_id": 0})
 
         except Exception as ex:
             print("An error occurred:", ex)
 
         return channel_data
 
-    def mongodb_videos_data(self, channel_id):
-        
-        find_id = f"SELECT playlist_id FROM channels WHERE channel_id = '{channel_id}'"
-        self.sqlite_cursor.execute(find_id)
-        playlist_id = self.sqlite_cursor.fetchone()[0]
+    def mongodb_videos_data(self, channel_id, video_ids=None):
+        video_data = []
+
+        with self._sqlite_lock:
+            self.sqlite_cursor.execute("SELECT playlist_id FROM channels WHERE channel_id = ?", (channel_id,))
+            playlist_id = self.sqlite_cursor.fetchone()[0]
 
         # Define the criteria for filtering the documents
-        criteria = {
-            "Playlist_ID": f"{playlist_id}",
-            "Video_ID": {"$ne": None},
-            "Video_Name": {"$ne": None},
-            "Video_Description": {"$ne": None},
-        }
+        criteria = {"Playlist_ID": playlist_id}
+        if video_ids is not None:
+            criteria["Video_ID"] = {"$in": list(video_ids)}
 
         try:
             # Retrieve video data from MongoDB
-            video_data = list(self.mongodb_collection.find(criteria, {"_id": 0}))
+            video_data = list(self.mongodb_videos.find(criteria, {"_id": 0}))
 
         except Exception as ex:
             print("An error occurred:", ex)
 
         return video_data
 
-    def mongodb_comments_data(self, channel_id):
-        
-        find_id = f"SELECT playlist_id FROM channels WHERE channel_id = '{channel_id}'"
-        self.sqlite_cursor.execute(find_id)
-        playlist_id = self.sqlite_cursor.fetchone()[0]
-        
-        find_id = f"SELECT video_id FROM videos WHERE playlist_id = '{playlist_id}'"
-        self.sqlite_cursor.execute(find_id)
-        video_ids = [video[0] for video in self.sqlite_cursor.fetchall()]
+    def mongodb_comments_data(self, channel_id, video_ids=None):
+        comment_data = []
 
-        # Define the criteria for filtering the documents
-        criteria = {
-            "Video_ID": {"$in": video_ids},
-            "Comment_ID": {"$ne": None},
-        }
+        if video_ids is None:
+            with self._sqlite_lock:
+                self.sqlite_cursor.execute(
+                    "SELECT v.video_id FROM videos v INNER JOIN channels c ON v.playlist_id = c.playlist_id "
+                    "WHERE c.channel_id = ?",
+                    (channel_id,),
+                )
+                video_ids = [video[0] for video in self.sqlite_cursor.fetchall()]
 
         try:
             # Retrieve comment data from MongoDB
-            comment_data = list(self.mongodb_collection.find(criteria, {"_id": 0}))
+            comment_data = list(self.mongodb_comments.find({"Video_ID": {"$in": list(video_ids)}}, {"_id": 0}))
 
         except Exception as ex:
             print("An error occurred:", ex)
 
         return comment_data
 
-
-
-    def insert_channel_data(self, document, sqlite_cursor):
-        query = """
-            INSERT INTO channels (
-                channel_id, channel_name, subscription_count, channel_views,
-                channel_description, playlist_id
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        """
-        values = (
+    def channel_values(self, document):
+        return (
             document["Channel_ID"],
             document["Channel_Name"],
             document["Subscription_Count"],
@@ -241,21 +682,14 @@ class YouTubeDataPipeline:
             document["Channel_Description"],
             document["Playlist_ID"],
         )
-        sqlite_cursor.execute(query, values)
 
-    def insert_video_data(self, document, table_name, sqlite_cursor):
-        query = f"""
-            INSERT INTO {table_name} (
-                video_id, video_name, video_description, tags,
-                published_at, view_count, like_count, favorite_count,
-                comment_count, duration, caption, thumbnail, playlist_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        values = (
+    def video_values(self, document):
+        tags = document["Tags"]
+        return (
             document["Video_ID"],
             document["Video_Name"],
             document["Video_Description"],
-            ', '.join(document["Tags"]),
+            ', '.join(tags) if isinstance(tags, list) else tags,
             document["Published_At"],
             document["View_Count"],
             document["Like_Count"],
@@ -266,23 +700,49 @@ class YouTubeDataPipeline:
             document["Thumbnail"],
             document["Playlist_ID"],
         )
-        sqlite_cursor.execute(query, values)
 
-    def insert_comments_data(self, document, sqlite_cursor):
-        query = """
-            INSERT INTO comments (
-                comment_Id, video_id, comment_text,
-                comment_author, comment_published_date
-            ) VALUES (?, ?, ?, ?, ?)
-        """
-        values = (
+    def comment_values(self, document):
+        return (
             document["Comment_ID"],
             document["Video_ID"],
             document["Comment_Text"],
             document["Comment_Author"],
             document["Comment_Published_At"],
         )
-        sqlite_cursor.execute(query, values)
+
+    def insert_channel_data(self, document, sqlite_cursor):
+        sqlite_cursor.execute(CHANNEL_UPSERT_QUERY, self.channel_values(document))
+
+    def insert_video_data(self, document, table_name, sqlite_cursor):
+        sqlite_cursor.execute(upsert_query(table_name, VIDEO_COLUMNS), self.video_values(document))
+
+    def insert_comments_data(self, document, sqlite_cursor):
+        sqlite_cursor.execute(COMMENT_UPSERT_QUERY, self.comment_values(document))
+
+    def bulk_load(self, stage, query, rows):
+        # One executemany per stage, committed by the caller's transaction.
+        # Rows counts only inserted or changed rows, unchanged upserts are skipped.
+        started = time.perf_counter()
+        self.sqlite_cursor.executemany(query, rows)
+        row_count = max(self.sqlite_cursor.rowcount, 0)
+        seconds = time.perf_counter() - started
+
+        self.load_stats[stage] = {
+            "rows": row_count,
+            "seconds": seconds,
+            "rows_per_second": row_count / seconds if seconds > 0 else float(row_count),
+        }
+        return self.load_stats[stage]
+
+    def bulk_insert_channels(self, documents):
+        return self.bulk_load("channels", CHANNEL_UPSERT_QUERY, (self.channel_values(document) for document in documents))
+
+    def bulk_insert_videos(self, documents, table_name="videos"):
+        query = upsert_query(table_name, VIDEO_COLUMNS)
+        return self.bulk_load("videos", query, (self.video_values(document) for document in documents))
+
+    def bulk_insert_comments(self, documents):
+        return self.bulk_load("comments", COMMENT_UPSERT_QUERY, (self.comment_values(document) for document in documents))
 
     def create_table_channels(self, sqlite_cursor):
         sqlite_cursor.execute(
@@ -290,8 +750,8 @@ class YouTubeDataPipeline:
             CREATE TABLE IF NOT EXISTS channels (
                 channel_id TEXT PRIMARY KEY,
                 channel_name TEXT,
-                subscription_count INT,
-                channel_views TEXT,
+                subscription_count INTEGER,
+                channel_views INTEGER,
                 channel_description TEXT,
                 playlist_id TEXT
             )
@@ -332,23 +792,163 @@ class YouTubeDataPipeline:
             """
         )
 
+    def create_table_sync_state(self, sqlite_cursor):
+        sqlite_cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS channel_sync_state (
+                channel_id TEXT PRIMARY KEY,
+                playlist_id TEXT,
+                newest_published_at DATETIME,
+                video_count INT,
+                last_synced_at DATETIME
+            )
+            """
+        )
+
+    def sink_to_mongodb(self, collection, documents, key):
+        # Direct mode: the data lake copy is written in the background, or skipped without a sink
+        if self.mongodb_sink is not None:
+            self.mongodb_sink.submit(collection, documents, key)
+
+    def flush_mongodb_sink(self):
+        # Waits for the background writes, raises MongoDBSinkError if any of them failed
+        if self.mongodb_sink is not None:
+            self.mongodb_sink.flush()
+
+    def store_channel_data(self, channel_id, youtube_channel_data):
+        # MongoDB I/O stays outside _sqlite_lock, other workers' transactions do not wait on it
+        if self.load_mode == DIRECT_LOAD:
+            self.sink_to_mongodb(self.mongodb_channels, [youtube_channel_data], "Channel_ID")
+            channel_data = youtube_channel_data
+        else:
+            # Store data in MongoDB, replacing the previous snapshot of the channel
+            self.mongodb_bulk_upsert(self.mongodb_channels, [youtube_channel_data], "Channel_ID")
+
+            # Fetch YouTube channel data from MongoDB
+            channel_data = self.mongodb_channel_data(channel_id)
+
+        # Create tables, load data to SQLite and refresh the channel's summaries in one transaction
+        with self._sqlite_lock, self.sqlite_connection:
+            self.create_table_channels(self.sqlite_cursor)
+            self.bulk_insert_channels([channel_data])
+            refresh_summaries(self.sqlite_connection, [channel_id])
+            bump_data_version(self.sqlite_connection)
+        self.report_progress("channels", rows=self.load_stats["channels"]["rows"])
+
+    def store_videos_data(self, channel_id, youtube_video_data):
+        if self.load_mode == DIRECT_LOAD:
+            self.sink_to_mongodb(self.mongodb_videos, youtube_video_data, "Video_ID")
+            video_data = youtube_video_data
+        else:
+            # Store data in MongoDB
+            self.mongodb_bulk_upsert(self.mongodb_videos, youtube_video_data, "Video_ID")
+
+            # Load data from MongoDB, only the videos fetched in this run when syncing incrementally
+            video_ids = self.get_new_video_ids(channel_id) if self.incremental else None
+            video_data = self.mongodb_videos_data(channel_id, video_ids)
+
+        # Create tables, insert video data, move the channel watermark forward and refresh summaries in one transaction
+        with self._sqlite_lock, self.sqlite_connection:
+            self.create_tables_videos(self.sqlite_cursor)
+            self.bulk_insert_videos(video_data)
+            self.update_sync_state(channel_id)
+            refresh_summaries(self.sqlite_connection, [channel_id])
+            bump_data_version(self.sqlite_connection)
+        self.report_progress("videos", rows=self.load_stats["videos"]["rows"])
+
+    def store_comments_data(self, channel_id, youtube_comment_data):
+        if self.load_mode == DIRECT_LOAD:
+            self.sink_to_mongodb(self.mongodb_comments, youtube_comment_data, "Comment_ID")
+            comment_data = youtube_comment_data
+        else:
+            # Store data in MongoDB
+            self.mongodb_bulk_upsert(self.mongodb_comments, youtube_comment_data, "Comment_ID")
+
+            # Load data from MongoDB
+            video_ids = self.get_new_video_ids(channel_id) if self.incremental else None
+            comment_data = self.mongodb_comments_data(channel_id, video_ids)
+
+        # Create tables, insert comment data and refresh summaries in one transaction
+        with self._sqlite_lock, self.sqlite_connection:
+            self.create_tables_comments(self.sqlite_cursor)
+            self.bulk_insert_comments(comment_data)
+            refresh_summaries(self.sqlite_connection, [channel_id])
+            bump_data_version(self.sqlite_connection)
+        self.report_progress("comments", rows=self.load_stats["comments"]["rows"])
+
+    def stream_load(self, stage, records, collection, key, create_table, bulk_insert, batch_size):
+        # Fetch, transform and load chained as generators: every batch_size records are written to
+        # MongoDB and committed to SQLite on their own, so memory stays bounded by the batch size
+        # and a failure only loses the batch in flight. SQLite is loaded from the fetched batch in both load modes.
+        total_rows = 0
+        total_seconds = 0.0
+
+        for batch in chunked(records, batch_size):
+            if self.load_mode == DIRECT_LOAD:
+                self.sink_to_mongodb(collection, batch, key)
+            else:
+                self.mongodb_bulk_upsert(collection, batch, key)
+
+            with self._sqlite_lock:
+                with self.sqlite_connection:
+                    create_table(self.sqlite_cursor)
+                    stats = bulk_insert(batch)
+            total_rows += stats["rows"]
+            total_seconds += stats["seconds"]
+            self.report_progress(stage, rows=stats["rows"])
+
+        self.load_stats[stage] = {
+            "rows": total_rows,
+            "seconds": total_seconds,
+            "rows_per_second": total_rows / total_seconds if total_seconds > 0 else float(total_rows),
+        }
+        return self.load_stats[stage]
+
+    def stream_videos_data(self, channel_id, batch_size=STREAM_BATCH_SIZE):
+        stats = self.stream_load(
+            "videos", self.iter_videos_info(channel_id), self.mongodb_videos, "Video_ID",
+            self.create_tables_videos, self.bulk_insert_videos, batch_size)
+
+        # The watermark and summaries move once every batch is in. Batches commit newest uploads first,
+        # so an incremental stage interrupted in between must fetch everything since the old watermark again.
+        with self._sqlite_lock, self.sqlite_connection:
+            self.update_sync_state(channel_id)
+            refresh_summaries(self.sqlite_connection, [channel_id])
+            bump_data_version(self.sqlite_connection)
+        return stats
+
+    def stream_comments_data(self, channel_id, batch_size=STREAM_BATCH_SIZE):
+        stats = self.stream_load(
+            "comments", self.iter_comments_info(channel_id), self.mongodb_comments, "Comment_ID",
+            self.create_tables_comments, self.bulk_insert_comments, batch_size)
+
+        with self._sqlite_lock, self.sqlite_connection:
+            refresh_summaries(self.sqlite_connection, [channel_id])
+            bump_data_version(self.sqlite_connection)
+        return stats
+
+    def update_sync_state(self, channel_id):
+        # Per-channel watermark: newest stored upload and when the channel was last synced
+        self.create_table_sync_state(self.sqlite_cursor)
+        self.sqlite_cursor.execute(
+            """
+            INSERT OR REPLACE INTO channel_sync_state (
+                channel_id, playlist_id, newest_published_at, video_count, last_synced_at
+            )
+            SELECT c.channel_id, c.playlist_id, MAX(v.published_at), COUNT(v.video_id), datetime('now')
+            FROM channels c LEFT JOIN videos v ON v.playlist_id = c.playlist_id
+            WHERE c.channel_id = ?
+            GROUP BY c.channel_id, c.playlist_id
+            """,
+            (channel_id,),
+        )
+
     def run_channel_pipeline(self, channel_id):
         try:
             # Fetch YouTube data
             youtube_channel_data = self.get_channel_info(channel_id)
 
-            # Store data in MongoDB
-            self.mongodb_collection.insert_one(youtube_channel_data)
-            
-             # Fetch YouTube channel data from MongoDB
-            channel_data  = self.mongodb_channel_data(channel_id)
-
-            #create tables
-            self.create_table_channels(self.sqlite_cursor)
-
-            # Load data from MongoDB to SQLite
-            self.insert_channel_data(channel_data, self.sqlite_cursor)
-            self.sqlite_connection.commit()
+            self.store_channel_data(channel_id, youtube_channel_data)
 
             st.success("Channel pipeline executed successfully.")
         except Exception as e:
@@ -359,21 +959,11 @@ class YouTubeDataPipeline:
             # Fetch YouTube data
             youtube_video_data = self.get_videos_info(channel_id)
 
-            # Store data in MongoDB
-            self.mongodb_collection.insert_many(youtube_video_data)
+            self.store_videos_data(channel_id, youtube_video_data)
 
-            #create tables
-            self.create_tables_videos(self.sqlite_cursor)
-
-            # Load data from MongoDB 
-            video_data = self.mongodb_videos_data(channel_id)
-
-            # Insert video data
-            for document in video_data:
-                self.insert_video_data(document, "videos", self.sqlite_cursor)
-            self.sqlite_connection.commit()
-
-            st.success("Videos pipeline executed successfully.")
+            stats = self.load_stats.get("videos", {})
+            st.success(f"Videos pipeline executed successfully. "
+                       f"Loaded {stats.get('rows', 0)} rows ({stats.get('rows_per_second', 0):,.0f} rows/s).")
         except Exception as e:
             st.error(f"Error in videos pipeline: {e}")
 
@@ -382,32 +972,36 @@ class YouTubeDataPipeline:
             # Fetch YouTube data
             youtube_comment_data = self.get_comments_info(channel_id)
 
-            # Store data in MongoDB
-            self.mongodb_collection.insert_many(youtube_comment_data)
-
-            # Create tables
-            self.create_tables_comments(self.sqlite_cursor)
-
-            # Load data from MongoDB
-            comment_data = self.mongodb_comments_data(channel_id)
+            self.store_comments_data(channel_id, youtube_comment_data)
 
-            for document in comment_data:
-                self.insert_comments_data(document, self.sqlite_cursor)
-            self.sqlite_connection.commit()
-
-            st.success("Comments pipeline executed successfully.")
+            stats = self.load_stats.get("comments", {})
+            st.success(f"Comments pipeline executed successfully. "
+                       f"Loaded {stats.get('rows', 0)} rows ({stats.get('rows_per_second', 0):,.0f} rows/s).")
         except Exception as e:
             st.error(f"Error in comments pipeline: {e}")
 
     def sql_query(self, query):
         try:
-            result = pd.read_sql_query(query, self.sqlite_connection)
+            # Only the dashboard reads through the pipeline, headless ingests never load pandas
+            import pandas as pd
+
+            with self._sqlite_lock:
+                result = pd.read_sql_query(query, self.sqlite_connection)
             return result
         except Exception as e:
             st.error(f"Error executing SQL query: {e}")
             return None
 
     def close_connections(self):
-        self.sqlite_connection.close()
-        self.mongodb_client.close()
+        # Let pending data lake writes finish before the client goes away, failed writes are raised after closing
+        try:
+            if self.mongodb_sink is not None:
+                self.mongodb_sink.close()
+        finally:
+            self.comment_executor.shutdown(wait=True, cancel_futures=True)
+            if self._owns_sqlite_connection:
+                self.sqlite_connection.close()
+            self.mongodb_client.close()
+            if self.response_cache is not None:
+                self.response_cache.close()
 